@@ -1,21 +1,31 @@
 """
 This script automates the generation of a wind simulation dataset using OpenFOAM and ParaView.
-It performs the following main steps for a list of specified angles:
-1.  Copies a base OpenFOAM case.
-2.  Rotates a base geometry (STL file) using FreeCAD's command line.
-3.  Runs a series of OpenFOAM commands (blockMesh, surfaceFeatureExtract, snappyHexMesh, simpleFoam)
-    to simulate wind flow around the rotated geometry.
-4.  Exports a slice of the simulation data to a CSV file using ParaView's pvpython.
-5.  Measures and records the execution time for each major step (FreeCAD, OpenFOAM, ParaView)
+It performs the following main steps for a list of specified angles, running the
+independent cases concurrently in a pool of worker processes:
+1.  Provisions a case from a base OpenFOAM case as a skeleton of symlinks, copying only
+    the files the script edits, in /dev/shm (tmpfs) when it has enough free space. Each
+    worker provisions its case right before running it.
+2.  Rotates a base geometry (STL file) with numpy (see rotate_stl.py), parsing it
+    once per worker process.
+3.  Runs a series of OpenFOAM commands (surfaceFeatureExtract, snappyHexMesh, simpleFoam)
+    to simulate wind flow around the rotated geometry, in parallel over a scotch decomposition.
+    The blockMesh background mesh is built once for all the cases.
+4.  Exports a slice of the simulation data to a binary .npz file using ParaView's pvpython, kept
+    running as a slice server by each worker process. With --insitu-slice, simpleFoam
+    writes the slice itself through a `surfaces` function object instead.
+5.  Measures and records the execution time for each major step (rotation, OpenFOAM, ParaView)
     and the total script duration into a JSON file.
 
 The script is designed to be run in a Linux-like environment (e.g., WSL on Windows).
 It includes an option to suppress subprocess output for a cleaner tqdm progress bar.
 
 Usage:
-    python dataset_wind_genrator.py [--suppress-output]
+    python dataset_wind_genrator.py [--suppress-output] [--insitu-slice]
+                                    [--sampling {sobol,random}] [--seed S] [--workers N] [--reuse-angle-cache] [--residual-tolerance 1e-4] [--max-iters 1000] [--fast-png]
 """
 import subprocess
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import shutil
 import time
@@ -23,309 +33,1374 @@ import json
 from tqdm import tqdm # Added import
 import platform
 import sys
+import argparse
 import re # Added import
 import itertools # Added import
-import random # Added import for random number generation
+import functools
+import hashlib
+from collections import deque
+from string import Template
+from typing import NamedTuple
 
-from visualize_wind_map import load_and_interpolate, extract_rotated_crop, export_simulated_data_arrays, export_incident_data_arrays , plot_ux_uy # plot_ux_uy commented out
+from rotate_stl import load_stl, rotate_batch, geometry_center as stl_geometry_center
+from visualize_wind_map import read_slice, load_and_interpolate, extract_rotated_crop, export_dataset_arrays, plot_ux_uy
 import numpy as np
-import cv2
+from scipy.stats import qmc
+import warnings
 from pathlib import Path
 
-def save_heatmap_cv2(array: np.ndarray, path: str, vmin: float, vmax: float):
-    norm = np.uint8(255 * np.clip((array - vmin) / (vmax - vmin), 0, 1))
-    heatmap = cv2.applyColorMap(norm, cv2.COLORMAP_VIRIDIS)
-    cv2.imwrite(str(Path(path)), heatmap)
-
 # If on Windows, display an error and exit.
 if platform.system() == "Windows":
     print("ERROR: This script is designed to be run in a Linux-like environment (e.g., WSL).")
     print("Please run it from WSL or a Linux environment.")
     sys.exit(1)
 
-def update_inlet_velocity(case_dir_path: Path, velocity_x: float):
+# Regex to find the Uinlet definition line, e.g., "Uinlet (10 0 0);"
+# It captures three groups:
+# 1. The part before the velocity values: "Uinlet          ("
+# 2. The velocity values themselves: "10 0 0"
+# 3. The part after the velocity values: ");"
+_UINLET_RE = re.compile(
+    rb"^(Uinlet\s+\()([^)]+)(\);)",  # Matches "Uinlet (values);"
+    re.MULTILINE  # ^ matches the beginning of a line
+)
+# Include file holding only the Uinlet definition, used when the base U file includes it
+INLET_VELOCITY_INCLUDE = Path("0.orig") / "include" / "inletVelocity"
+_INLET_VELOCITY_INCLUDE_DIRECTIVE = b'#include "include/inletVelocity"'
+INLET_VELOCITY_FILE = Path("0.orig") / "U"
+
+@functools.lru_cache(maxsize=None)
+def load_inlet_velocity_template(base_case_path: Path) -> tuple:
     """
-    Updates the inlet velocity in the OpenFOAM U file by modifying the Uinlet variable.
+    Loads the template of the file defining the inlet velocity, with a `$VELOCITY_X` placeholder.
+
+    When the base `0.orig/U` contains `#include "include/inletVelocity"`, only
+    that ~20-byte include file is written per case and U stays a link to the
+    base case. Otherwise the whole U file is templated: from `0.orig/U.template`
+    when it exists, else derived from `0.orig/U` by replacing the values of the
+    `Uinlet` definition, so the regex runs once per process instead of once per
+    case. OpenFOAM macros (`$internalField`, ...) are left untouched on substitution.
+
+    Args:
+        base_case_path: Path to the base OpenFOAM case.
+
+    Returns:
+        The case-relative path of the file to write and its template.
+    """
+    u_file_path = base_case_path / INLET_VELOCITY_FILE
+    template_path = u_file_path.with_name("U.template")
+    content = u_file_path.read_bytes()
+    if _INLET_VELOCITY_INCLUDE_DIRECTIVE in content:
+        return INLET_VELOCITY_INCLUDE, Template("Uinlet (${VELOCITY_X} 0 0);\n")
+    if template_path.exists():
+        template = Template(template_path.read_text())
+    else:
+        # Escape OpenFOAM's "$" before inserting the placeholder
+        content = content.replace(b"$", b"$$")
+        template = Template(_UINLET_RE.sub(rb"\g<1>${VELOCITY_X} 0 0\g<3>", content).decode())
+    if "VELOCITY_X" not in template.get_identifiers():
+        print(f"⚠️ Warning: no inlet velocity placeholder in the U file template of {base_case_path}.")
+        print(f"   Expected 0.orig/U.template with 'Uinlet ($VELOCITY_X 0 0);' or a line like 'Uinlet (...);' in 0.orig/U.")
+        print(f"   If the format is different, the script may not work as expected.")
+    return INLET_VELOCITY_FILE, template
+
+
+def update_inlet_velocity(case_dir_path: Path, velocity_x: float, template: Template,
+                          relative_path: Path = INLET_VELOCITY_FILE):
+    """
+    Writes the file defining the inlet velocity of a case.
+
+    The provisioned file is a link to the base case, so it is removed before
+    being written as a regular file.
 
     Args:
         case_dir_path: Path to the case directory.
         velocity_x: The x-component of the velocity for the inlet.
+        template: Template of the file (see `load_inlet_velocity_template`).
+        relative_path: Case-relative path of the file (see `load_inlet_velocity_template`).
+    """
+    u_file_path = case_dir_path / relative_path
+    try:
+        u_file_path.unlink(missing_ok=True)
+        u_file_path.write_bytes(template.safe_substitute(VELOCITY_X=velocity_x).encode())
+        if "--suppress-output" not in sys.argv:
+            print(f"💨 Uinlet variable updated to ({velocity_x} 0 0) in {u_file_path}")
+    except Exception as e:
+        print(f"❌ Failed to update Uinlet in {u_file_path}: {e}")
+        sys.exit(1)
+
+
+# === Parameters ===
+# Module-level so that the worker processes of the case pool see the same values.
+# angles = [45,0,5,7,90,98,178,270] # Example with more angles - Replaced by random generation
+# velocities = [15] # Example velocities in m/s - Replaced by random generation
+NB_COUPLES = 10  # Number of angle-velocity pairs to generate
+VELOCITY_MIN_MPS = 5.0  # Minimum velocity in m/s
+VELOCITY_MAX_MPS = 10.0 # Maximum velocity in m/s
+ANGLE_MIN_DEG = 0.0     # Minimum angle in degrees
+ANGLE_MAX_DEG = 360.0   # Maximum angle in degrees (exclusive for rng.uniform, but 360 is fine for full circle)
+BASE_GEOMETRY = Path("/mnt/c/Users/r.davenne/Documents/geometry/base_buildings.stl")
+BASE_CASE = Path("/home/rdavenne/OpenFOAM_cases/windAroundBuildings")
+OUTPUT_DIR = Path("/home/rdavenne/OpenFOAM_cases/test_dataset")
+# Helper scripts, resolved once next to this file (not relative to the working directory)
+SCRIPTS_DIR = Path(__file__).resolve().parent
+SLICE_SCRIPT = SCRIPTS_DIR / "slice_and_export.py"
+# visualization_output_dir = output_dir / "visualizations" # Directory for saving plots - Replaced by dataset_processed_dir
+DATASET_PROCESSED_DIR = OUTPUT_DIR / "dataset_processed" # New directory for structured dataset
+# Working directory of the OpenFOAM cases: tmpfs when available, so that meshing and solver
+# I/O hit RAM instead of the disk (or WSL's 9p). Only the dataset files reach OUTPUT_DIR.
+# One subdirectory per OUTPUT_DIR, so that concurrent sweeps do not share their cases.
+SHM_DIR = Path("/dev/shm")
+# Free tmpfs space below which the cases run in OUTPUT_DIR instead (Docker's default /dev/shm is 64 MB)
+SHM_MIN_FREE_BYTES = 2 * 1024**3
+OUTPUT_DIR_KEY = f"{OUTPUT_DIR.name}_{hashlib.sha1(str(OUTPUT_DIR.absolute()).encode()).hexdigest()[:8]}"
+
+
+def _shm_usable() -> bool:
+    """Tells whether SHM_DIR is writable with at least SHM_MIN_FREE_BYTES free."""
+    try:
+        return os.access(SHM_DIR, os.W_OK) and shutil.disk_usage(SHM_DIR).free >= SHM_MIN_FREE_BYTES
+    except OSError:
+        return False
+
+
+CASES_SCRATCH_DIR = SHM_DIR / "of_cases" / OUTPUT_DIR_KEY if _shm_usable() else OUTPUT_DIR
+CROP_SIZE_VISUALIZATION = (230.0, 230.0)  # Taille du domaine autour de la ville pour la visualisation
+OUTPUT_RESOLUTION_VISUALIZATION = (2000, 2000) # Résolution de l'image de visualisation
+OPENFOAM_PROCS_PER_CASE = 4  # Subdomains (MPI ranks) of one OpenFOAM run, 1 runs it serially
+# Ranks actually launched: mpirun aborts when asked for more ranks than the machine has cores
+OPENFOAM_PROCS = min(OPENFOAM_PROCS_PER_CASE, os.cpu_count() or 1)
+OPENFOAM_BASHRC = "/usr/lib/openfoam/openfoam2412/etc/bashrc"
+
+
+# Larger chunks for shutil's read()/write() loop, used when the kernel copy fast path is unavailable
+shutil.COPY_BUFSIZE = 1024 * 1024
+
+
+def _copytree_multithreaded(src_dir: Path, dst_dir: Path, max_workers: int = 8):
+    """
+    Copies a directory tree, dispatching the per-file copies to a thread pool.
+
+    OpenFOAM cases hold many small dictionaries, so the copy time is mostly
+    open/close syscall latency which the threads overlap. Directories are
+    created while walking the tree (with `os.scandir`, which avoids extra
+    stat() calls), the files are copied with `shutil.copy2`.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        pending_dirs = [(Path(src_dir), Path(dst_dir))]
+        while pending_dirs:
+            src, dst = pending_dirs.pop()
+            dst.mkdir(parents=True, exist_ok=True)
+            with os.scandir(src) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        pending_dirs.append((Path(entry.path), dst / entry.name))
+                    else:
+                        futures.append(executor.submit(shutil.copy2, entry.path, dst / entry.name))
+        for future in futures:
+            future.result() # Re-raise copy errors
+
+
+def clone_base_case(base_case_path: Path, case_dir_path: Path):
     """
-    u_file_path = case_dir_path / "0.orig" / "U"
-    if not u_file_path.exists():
-        print(f"❌ Error: U file not found at {u_file_path}")
+    Copies the base case into a new case directory.
+
+    Uses `cp --reflink=auto`, which clones the files copy-on-write on filesystems
+    supporting it (btrfs, xfs) and silently falls back to a regular copy elsewhere.
+    If `cp` is not usable, the tree is copied with a thread pool instead.
+
+    Args:
+        base_case_path: Path to the base OpenFOAM case.
+        case_dir_path: Path to the case directory to create (must not exist).
+    """
+    try:
+        subprocess.run(["cp", "-r", "--reflink=auto", str(base_case_path), str(case_dir_path)], check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"⚠️ cp --reflink failed ({e}), falling back to a threaded copy for {case_dir_path}")
+        if case_dir_path.exists():
+            shutil.rmtree(case_dir_path)
+        _copytree_multithreaded(base_case_path, case_dir_path)
+
+
+# Base case files edited in place by the pipeline: copied into every case instead of linked
+MUTABLE_CASE_FILES = (
+    "system/controlDict",
+    "system/fvSolution",
+    "system/snappyHexMeshDict",
+)
+# Base case entries (re)written for every case by the pipeline or OpenFOAM: neither linked nor copied
+CASE_OUTPUT_ENTRIES = (
+    "0",
+    "constant/polyMesh",
+    "constant/extendedFeatureEdgeMesh",
+    "constant/triSurface/buildings.stl",
+    "system/decomposeParDict",
+    "postProcessing",
+    "case.foam",
+)
+
+
+def _is_case_output(relative_path: str) -> bool:
+    """Tells whether a base case entry is produced per case and must not be shared."""
+    if relative_path in CASE_OUTPUT_ENTRIES or relative_path.endswith(".eMesh"):
+        return True
+    top_level = relative_path.split("/", 1)[0]
+    if top_level.startswith("processor"):
+        return True
+    try:
+        float(top_level) # Time directories of a previous run
+        return True
+    except ValueError:
+        return False
+
+
+def _link_file(src: str, dst: Path):
+    """Links `dst` to `src`: a symlink, else a hardlink, else a copy (e.g. on filesystems without links)."""
+    try:
+        os.symlink(src, dst)
         return
+    except OSError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
 
+def provision_case(base_case_path: Path, case_dir_path: Path, mutable=MUTABLE_CASE_FILES):
+    """
+    Creates a case directory as a skeleton of links to the base case.
+
+    The directories are created for real (OpenFOAM adds files to them), every
+    file is a link to its base case counterpart except the `mutable` ones,
+    which are copied so they can be edited, and the per-case outputs, which are
+    left out. OpenFOAM reads through the links, so provisioning costs a few
+    syscalls per file instead of copying the whole case. Files are symlinked,
+    or hardlinked (then copied) where the filesystem does not support it; since
+    edited files are always copies and outputs are written as new files, a
+    hardlink never propagates a change back to the base case. Falls back to a
+    full copy if the skeleton cannot be created.
+
+    Args:
+        base_case_path: Path to the base OpenFOAM case.
+        case_dir_path: Path to the case directory to create (must not exist).
+        mutable: Case-relative paths of the files to copy instead of linking.
+    """
+    base_case_path = base_case_path.resolve()
     try:
-        content = u_file_path.read_text()
-        
-        # Regex to find the Uinlet definition line, e.g., "Uinlet (10 0 0);"
-        # It captures three groups:
-        # 1. The part before the velocity values: "Uinlet          ("
-        # 2. The velocity values themselves: "10 0 0"
-        # 3. The part after the velocity values: ");"
-        pattern = re.compile(
-            r"^(Uinlet\s+\()([^)]+)(\);)",  # Matches "Uinlet (values);"
-            re.MULTILINE  # ^ matches the beginning of a line
+        pending_dirs = [(base_case_path, case_dir_path)]
+        while pending_dirs:
+            src, dst = pending_dirs.pop()
+            dst.mkdir(parents=True, exist_ok=True)
+            with os.scandir(src) as entries:
+                for entry in entries:
+                    relative_path = Path(entry.path).relative_to(base_case_path).as_posix()
+                    if _is_case_output(relative_path):
+                        continue
+                    if entry.is_dir():
+                        pending_dirs.append((Path(entry.path), dst / entry.name))
+                    elif relative_path in mutable:
+                        shutil.copy2(entry.path, dst / entry.name)
+                    else:
+                        _link_file(entry.path, dst / entry.name)
+    except OSError as e:
+        print(f"⚠️ Could not link the base case ({e}), copying it to {case_dir_path} instead")
+        if case_dir_path.exists():
+            shutil.rmtree(case_dir_path)
+        clone_base_case(base_case_path, case_dir_path)
+
+
+def _foam_entry_re(key: str, indented: bool = False) -> re.Pattern:
+    """Regex matching a `key value;` entry of an OpenFOAM dictionary, at top level unless `indented`."""
+    indent = r"[ \t]*" if indented else ""
+    return re.compile(rf"^({indent}{re.escape(key)}[ \t]+)([^;\n]*)(;)", re.MULTILINE)
+
+
+def read_foam_entry(text: str, key: str, indented: bool = False):
+    """Returns the value of the first `key value;` entry of an OpenFOAM dictionary text, or None."""
+    match = _foam_entry_re(key, indented).search(text)
+    return match.group(2).strip() if match else None
+
+
+def set_foam_entries(dict_path: Path, entries: dict, indented: bool = False):
+    """
+    Sets `key value;` entries of an OpenFOAM dictionary file.
+
+    The first matching entry of each key is replaced in place, keys not found
+    are appended at the end of the file.
+
+    Args:
+        dict_path: Path to the dictionary file (must not be a link to the base case).
+        entries: Values to set, by key.
+        indented: Whether to also match indented (nested) entries.
+    """
+    text = dict_path.read_text()
+    for key, value in entries.items():
+        text, num_replacements = _foam_entry_re(key, indented).subn(
+            lambda match: f"{match.group(1)}{value}{match.group(3)}", text, count=1
         )
-        
-        def replace_uinlet_velocity(match):
-            # Reconstruct the line with the new velocity_x, keeping Y and Z as 0
-            # match.group(1) is "Uinlet          ("
-            # match.group(3) is ");"
-            return f"{match.group(1)}{velocity_x} 0 0{match.group(3)}"
-
-        new_content, num_replacements = pattern.subn(replace_uinlet_velocity, content)
-
-        if num_replacements > 0:
-            u_file_path.write_text(new_content)
-            if "--suppress-output" not in sys.argv:
-                print(f"💨 Uinlet variable updated to ({velocity_x} 0 0) in {u_file_path}")
-        else:
-            print(f"⚠️ Warning: Uinlet definition line not found or not updated in {u_file_path}.")
-            print(f"   Searched for a line like 'Uinlet (...);'. Please check the U file format at {u_file_path}")
-            print(f"   If the format is different, the script may not work as expected.")
+        if num_replacements == 0:
+            text += f"\n{key} {value};\n"
+    dict_path.write_text(text)
 
 
-    except Exception as e:
-        print(f"❌ Failed to update Uinlet in {u_file_path}: {e}")
-        sys.exit(1)
+def limit_written_time_steps(case_dir_path: Path):
+    """
+    Makes simpleFoam write only the last time step of the run.
 
+    Only the final fields are sliced, so `writeInterval` is set to the whole run
+    (`endTime / deltaT` steps) with `purgeWrite 1`. simpleFoam still writes the
+    converged time step when residualControl stops it early.
 
-def main_script_logic():
+    Args:
+        case_dir_path: Path to the case directory.
     """
-    Main logic for the dataset generation script.
+    control_dict_path = case_dir_path / "system" / "controlDict"
+    text = control_dict_path.read_text()
+    try:
+        nb_time_steps = round(float(read_foam_entry(text, "endTime")) / float(read_foam_entry(text, "deltaT")))
+    except (TypeError, ValueError):
+        print(f"⚠️ Warning: could not read endTime/deltaT from {control_dict_path}, keeping its write settings.")
+        return
+    set_foam_entries(control_dict_path, {
+        "writeControl": "timeStep",
+        "writeInterval": max(1, nb_time_steps),
+        "purgeWrite": 1,
+    })
 
-    Handles argument parsing for output suppression, sets up parameters,
-    iterates through specified angles to perform geometry rotation, OpenFOAM simulation,
-    and ParaView data extraction. It also times each significant operation and
-    saves these timings to a JSON file.
+
+def apply_solver_settings(case_dir_path: Path, residual_tolerance: float = None, max_iters: int = None):
     """
-    # === Script arguments for suppression ===
-    # (This is a simple way to handle it, consider argparse for more complex CLI args)
-    suppress_subprocess_output = "--suppress-output" in sys.argv
-
-    # === Parameters ===
-    # angles = [45,0,5,7,90,98,178,270] # Example with more angles - Replaced by random generation
-    # velocities = [15] # Example velocities in m/s - Replaced by random generation
-    nb_couples = 10  # Number of angle-velocity pairs to generate
-    velocity_min_mps = 5.0  # Minimum velocity in m/s
-    velocity_max_mps = 10.0 # Maximum velocity in m/s
-    angle_min_deg = 0.0     # Minimum angle in degrees
-    angle_max_deg = 360.0   # Maximum angle in degrees (exclusive for random.uniform, but 360 is fine for full circle)
-    vmin_scale = -20.0  # Minimum scale for heatmap
-    vmax_scale = 20.0 # Scale for the color map in heatmap visualization
-    base_geometry = Path("/mnt/c/Users/r.davenne/Documents/geometry/base_buildings.stl")
-    base_case = Path("/home/rdavenne/OpenFOAM_cases/windAroundBuildings")
-    output_dir = Path("/home/rdavenne/OpenFOAM_cases/test_dataset")
-    # freecad_script = Path("rotate_stl.py") # Assuming this is in the same dir or PATH - This variable is not used
-    slice_script = Path("utils_scripts/slice_and_export.py") # Assuming this path is correct relative to execution
-    # visualization_output_dir = output_dir / "visualizations" # Directory for saving plots - Replaced by dataset_processed_dir
-    dataset_processed_dir = output_dir / "dataset_processed" # New directory for structured dataset
-    crop_size_visualization = (230.0, 230.0)  # Taille du domaine autour de la ville pour la visualisation
-    output_resolution_visualization = (2000, 2000) # Résolution de l'image de visualisation
-
-    output_dir.mkdir(exist_ok=True)
-    # visualization_output_dir.mkdir(exist_ok=True) # Create visualization directory - Replaced
-    dataset_processed_dir.mkdir(exist_ok=True) # Create processed dataset directory
+    Loosens the simpleFoam convergence settings of a case.
 
-    script_timings = {} # To store timings
-    total_script_start_time = time.time() # Start general timer
+    A dataset meant to train a model does not need converging to the base case
+    residuals: every linear solver `tolerance` of fvSolution (p, U, k, epsilon,
+    ...) is set to `residual_tolerance` and `endTime` is capped to `max_iters`
+    SIMPLE iterations after `startTime`. Must run before `limit_written_time_steps`,
+    which derives the write interval from `endTime`.
 
-    # Generate angle-velocity pairs
-    angle_velocity_pairs = []
-    for _ in range(nb_couples):
-        angle = random.uniform(angle_min_deg, angle_max_deg)
-        velocity = random.uniform(velocity_min_mps, velocity_max_mps)
-        angle_velocity_pairs.append((angle, velocity))
-
-    # Use tqdm for the loop, disable if output is suppressed to avoid tqdm printing
-    # for angle, velocity in tqdm(list(itertools.product(angles, velocities)), desc="Processing angle/velocity combinations", disable=suppress_subprocess_output):
-    for angle, velocity in tqdm(angle_velocity_pairs, desc="Processing angle/velocity combinations", disable=suppress_subprocess_output):
-        # Round angle and velocity for directory naming to avoid overly long/precise float names
-        # You can adjust the precision as needed
-        angle_for_naming = round(angle, 2)
-        velocity_for_naming = round(velocity, 2)
-
-        case_dir = output_dir / f"case_angle_{angle_for_naming}_vel_{velocity_for_naming}"
-        case_geometry = case_dir / "constant/triSurface/buildings.stl"
-
-        # Copy the base case
-        if case_dir.exists():
-            shutil.rmtree(case_dir)
-        shutil.copytree(base_case, case_dir)
+    Args:
+        case_dir_path: Path to the case directory.
+        residual_tolerance: Linear solver tolerance, base case value kept if None.
+        max_iters: Maximum number of SIMPLE iterations, base case value kept if None.
+    """
+    if residual_tolerance is not None:
+        fv_solution_path = case_dir_path / "system" / "fvSolution"
+        text, num_replacements = _foam_entry_re("tolerance", indented=True).subn(
+            lambda match: f"{match.group(1)}{residual_tolerance:g}{match.group(3)}", fv_solution_path.read_text()
+        )
+        if num_replacements == 0:
+            print(f"⚠️ Warning: no solver tolerance found in {fv_solution_path}, keeping its settings.")
+        fv_solution_path.write_text(text)
 
-        # Update inlet velocity in the U file
-        update_inlet_velocity(case_dir, velocity)
+    if max_iters is not None:
+        control_dict_path = case_dir_path / "system" / "controlDict"
+        text = control_dict_path.read_text()
+        try:
+            start_time = float(read_foam_entry(text, "startTime") or 0)
+            delta_t = float(read_foam_entry(text, "deltaT"))
+            end_time = float(read_foam_entry(text, "endTime"))
+        except (TypeError, ValueError):
+            print(f"⚠️ Warning: could not read startTime/deltaT/endTime from {control_dict_path}, keeping its endTime.")
+            return
+        capped_end_time = start_time + max_iters * delta_t
+        if capped_end_time < end_time:
+            set_foam_entries(control_dict_path, {"endTime": f"{capped_end_time:g}"})
+
+
+def configure_parallel_run(case_dir_path: Path, n_procs: int):
+    """
+    Adapts the case dictionaries to a run over `n_procs` subdomains.
+
+    Fields are written in binary (`writeFormat binary`), which is faster to write,
+    decompose and reconstruct than ascii. In parallel, snappyHexMesh's
+    `maxLocalCells` is set to the per-subdomain share of `maxGlobalCells`.
+
+    Args:
+        case_dir_path: Path to the case directory.
+        n_procs: Number of subdomains, 1 for a serial run.
+    """
+    set_foam_entries(case_dir_path / "system" / "controlDict", {"writeFormat": "binary"})
+    if n_procs <= 1:
+        return
+    snappy_dict_path = case_dir_path / "system" / "snappyHexMeshDict"
+    try:
+        max_global_cells = int(float(read_foam_entry(snappy_dict_path.read_text(), "maxGlobalCells", indented=True)))
+    except (TypeError, ValueError):
+        print(f"⚠️ Warning: could not read maxGlobalCells from {snappy_dict_path}, keeping its maxLocalCells.")
+        return
+    set_foam_entries(snappy_dict_path, {"maxLocalCells": max(1, max_global_cells // n_procs)}, indented=True)
+
+
+INSITU_SLICE_FUNCTION_NAME = "windSlice"
+# OpenFOAM function object sampling U on the same Z=20 plane as slice_and_export.py.
+# Merged into the existing `functions` dictionary of controlDict, if any.
+INSITU_SLICE_FUNCTION = f"""
+functions
+{{
+    {INSITU_SLICE_FUNCTION_NAME}
+    {{
+        type                surfaces;
+        libs                (sampling);
+        writeControl        onEnd;
+        surfaceFormat       raw;
+        fields              (U);
+        interpolationScheme cellPoint;
+        surfaces
+        {{
+            zSlice
+            {{
+                type        cuttingPlane;
+                planeType   pointAndNormal;
+                pointAndNormalDict
+                {{
+                    point   (0 0 20);
+                    normal  (0 0 1);
+                }}
+                interpolate true;
+            }}
+        }}
+    }}
+}}
+"""
+
+
+def add_insitu_slice(case_dir_path: Path):
+    """
+    Makes the solver write the wind slice itself, replacing the ParaView export.
+
+    Appends the `surfaces` function object to `system/controlDict`: simpleFoam samples U on the slice plane
+    at the end of the run and writes it as a raw point file, so the case never
+    has to be reloaded from disk by pvpython.
+
+    Args:
+        case_dir_path: Path to the case directory.
+    """
+    with open(case_dir_path / "system" / "controlDict", 'a') as f_control:
+        f_control.write(INSITU_SLICE_FUNCTION)
+
+
+def find_insitu_slice(case_dir_path: Path):
+    """Returns the U slice of the last time written by `add_insitu_slice`'s function object, or None."""
+    time_dirs = []
+    for time_dir in (case_dir_path / "postProcessing" / INSITU_SLICE_FUNCTION_NAME).glob("*"):
+        try:
+            time_dirs.append((float(time_dir.name), time_dir))
+        except ValueError:
+            continue
+    for _, time_dir in sorted(time_dirs, reverse=True):
+        raw_files = sorted(time_dir.glob("*U*.raw"))
+        if raw_files:
+            return raw_files[0]
+    return None
+
+
+def write_decompose_par_dict(case_dir_path: Path, n_procs: int):
+    """
+    Writes `system/decomposeParDict` for a scotch decomposition in `n_procs` subdomains.
+
+    Scotch needs no geometric hints and balances the subdomains automatically,
+    which suits meshes whose shape changes with the rotation angle.
+
+    Args:
+        case_dir_path: Path to the case directory.
+        n_procs: Number of subdomains.
+    """
+    decompose_dict_path = case_dir_path / "system" / "decomposeParDict"
+    decompose_dict_path.write_text(f"""FoamFile
+{{
+    version     2.0;
+    format      ascii;
+    class       dictionary;
+    object      decomposeParDict;
+}}
+
+numberOfSubdomains {n_procs};
+
+method          scotch;
+""")
+
+
+OPENFOAM_OUTPUT_TAIL_LINES = 100 # Last lines of OpenFOAM output kept to report a failure
+
+
+def run_openfoam_bash(bash_cmd: str, suppress_subprocess_output: bool):
+    """
+    Runs an OpenFOAM bash script, streaming its output line by line.
 
-        rotate_path = Path("utils_scripts/rotate_stl.py").resolve()
-        snappy_dict_path = case_dir / "system/snappyHexMeshDict"
-        freecad_start_time = time.time() # Timer for FreeCAD
-        geometry_center = None # Initialize variable to store center
+    Only the last `OPENFOAM_OUTPUT_TAIL_LINES` lines are kept (printed as they
+    come unless suppressed), so memory stays bounded whatever the length of the
+    solver log, and they are printed if the script fails, even when suppressed.
+
+    Raises:
+        subprocess.CalledProcessError: If the script exits with a non-zero code.
+    """
+    tail = deque(maxlen=OPENFOAM_OUTPUT_TAIL_LINES)
+    with subprocess.Popen(
+        ["bash", "-c", bash_cmd], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+    ) as process:
+        for line in process.stdout:
+            tail.append(line)
+            if not suppress_subprocess_output:
+                print(line, end="")
+    if process.returncode != 0:
+        if suppress_subprocess_output:
+            print(f"❌ OpenFOAM failed (exit code {process.returncode}), last {len(tail)} lines of output:")
+            print("".join(tail), end="")
+        raise subprocess.CalledProcessError(process.returncode, bash_cmd)
+
+
+BACKGROUND_MESH_DIR = CASES_SCRATCH_DIR / "base_case_prepared"
+
+
+def build_background_mesh(suppress_subprocess_output: bool) -> Path:
+    """
+    Runs blockMesh once for the whole sweep.
+
+    The background mesh only depends on the base case, not on the angle or the
+    velocity, so it is built in `BACKGROUND_MESH_DIR` and copied into every case
+    by `prepare_case` instead of rerunning blockMesh per case.
+
+    Returns:
+        Path to the background `polyMesh` directory.
+    """
+    if BACKGROUND_MESH_DIR.exists():
+        shutil.rmtree(BACKGROUND_MESH_DIR)
+    provision_case(BASE_CASE, BACKGROUND_MESH_DIR)
+    run_openfoam_bash(f"source {OPENFOAM_BASHRC} && cd {BACKGROUND_MESH_DIR} && blockMesh", suppress_subprocess_output)
+    return BACKGROUND_MESH_DIR / "constant" / "polyMesh"
+
+
+STEP_TIMINGS_FILE_NAME = "step_timings.log"
+# Entries of 0.orig which are not fields (templates, backups), as a bash `case` pattern
+NON_FIELD_FILE_PATTERNS = "*.template|*.orig|*.bak|*~|.*"
+# "<stage> <$EPOCHREALTIME>" lines of the step timings log
+_STEP_TIMING_RE = re.compile(rb"^(\w+) ([0-9]+[.,][0-9]+)$", re.MULTILINE)
+
+
+def build_openfoam_cmd(case_dir_path: Path, n_procs: int, block_mesh: bool = False) -> str:
+    """
+    Builds the bash command meshing and solving a case with OpenFOAM.
+
+    The background mesh is already in the case (see `build_background_mesh`),
+    unless `block_mesh` is set, in which case blockMesh runs first in the case.
+    With `n_procs > 1` it is decomposed and both snappyHexMesh
+    and simpleFoam run with MPI on `n_procs` ranks before the mesh and the last
+    time step are reconstructed. `n_procs == 1` keeps the serial run, which is
+    faster for small meshes.
+
+    The initial fields are only read by simpleFoam, so the `0` directories
+    (and every `processor*/0`, as snappyHexMesh adds patches) are created as
+    symlinks to the `0.orig` fields, leaving out the non-field files
+    (`NON_FIELD_FILE_PATTERNS`, e.g. `U.template`). This happens after meshing since
+    snappyHexMesh rewrites the fields it finds in `0`. The end time of every
+    stage is appended to `STEP_TIMINGS_FILE_NAME` (see `read_step_timings`).
+    The script stops at the first failing command (`set -eo pipefail`, enabled
+    after sourcing the OpenFOAM environment, which is not `set -e` safe), so its
+    exit code reports a failed snappyHexMesh, simpleFoam or mpirun to
+    `run_openfoam_bash`.
+
+    Args:
+        case_dir_path: Path to the case directory.
+        n_procs: Number of MPI ranks.
+        block_mesh: Whether to build the background mesh in the case.
+
+    Returns:
+        The script to pass to `bash -c`.
+    """
+    background_mesh = """
+    blockMesh""" if block_mesh else ""
+    if n_procs <= 1:
+        snappy = """
+    snappyHexMesh -overwrite"""
+        solve = """
+    simpleFoam"""
+    else:
+        snappy = f"""
+    decomposePar -force
+    mpirun -np {n_procs} snappyHexMesh -overwrite -parallel"""
+        solve = f"""
+    for proc_dir in processor*; do link_fields $proc_dir/0; done
+    mpirun -np {n_procs} simpleFoam -parallel
+    reconstructParMesh -constant
+    reconstructPar -latestTime"""
+    return f"""
+    source {OPENFOAM_BASHRC}
+    set -eo pipefail
+    cd {case_dir_path}
+    link_fields() {{
+        rm -rf "$1"; mkdir -p "$1"
+        for field in 0.orig/*; do
+            case "${{field##*/}}" in {NON_FIELD_FILE_PATTERNS}) continue;; esac
+            ln -s "$(readlink -f "$field")" "$1/" || cp -rL "$field" "$1/"
+        done
+    }}
+    echo "start $EPOCHREALTIME" > {STEP_TIMINGS_FILE_NAME}{background_mesh}
+    surfaceFeatureExtract{snappy}
+    echo "meshing $EPOCHREALTIME" >> {STEP_TIMINGS_FILE_NAME}
+    link_fields 0{solve}
+    echo "solving $EPOCHREALTIME" >> {STEP_TIMINGS_FILE_NAME}
+    touch case.foam
+    exit
+    """
+
+
+def read_step_timings(case_dir_path: Path) -> dict:
+    """Durations of the OpenFOAM stages logged by `build_openfoam_cmd`'s script, by stage."""
+    step_timings = {}
+    previous_time = None
+    for match in _STEP_TIMING_RE.finditer((case_dir_path / STEP_TIMINGS_FILE_NAME).read_bytes()):
+        step = match.group(1).decode()
+        current_time = float(match.group(2).replace(b",", b".")) # $EPOCHREALTIME follows the locale
+        if previous_time is not None:
+            step_timings[f"openfoam_{step}"] = current_time - previous_time
+        previous_time = current_time
+    return step_timings
+
+
+def case_worker_count(nb_cases: int, max_workers: int = None) -> int:
+    """
+    Number of cases to run concurrently.
+
+    `max_workers` if given, else capped so that `workers * OPENFOAM_PROCS <= cores`,
+    and never more than the number of cases to process.
+    """
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) // OPENFOAM_PROCS
+    return max(1, min(nb_cases, max_workers))
+
+
+# Persistent pvpython slice server of the current process, started on its first slice export
+_paraview_server = None
+
+
+def _get_paraview_server(suppress_subprocess_output: bool) -> subprocess.Popen:
+    """
+    Returns the running `slice_and_export.py --server` process, starting it if needed.
+
+    Raises:
+        RuntimeError: If pvpython cannot be started.
+    """
+    global _paraview_server
+    if _paraview_server is None or _paraview_server.poll() is not None:
         try:
-            process_result = subprocess.run([
-                "freecadcmd", str(rotate_path),
-                str(base_geometry),
-                str(case_geometry),
-                str(angle),
-                str(snappy_dict_path)
-            ], check=True,
-            capture_output=True, text=True # Capture output
-            # stdout=None if not suppress_subprocess_output else subprocess.DEVNULL, # Will be replaced by capture_output
-            # stderr=None if not suppress_subprocess_output else subprocess.DEVNULL # Will be replaced by capture_output
+            _paraview_server = subprocess.Popen(
+                ["pvpython", str(SLICE_SCRIPT), "--server"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL if suppress_subprocess_output else None,
+                text=True, bufsize=1, # Line buffered: one request per line
             )
-            
-            # Process stdout to find the geometry center
-            if process_result.stdout:
-                if not suppress_subprocess_output:
-                    print(process_result.stdout) # Print FreeCAD output if not suppressed
-                for line in process_result.stdout.splitlines():
-                    if line.startswith("GEOMETRY_CENTER:"):
-                        try:
-                            coords_str = line.split(":")[1]
-                            x, y, z = map(float, coords_str.split(','))
-                            geometry_center = {"x": x, "y": y, "z": z}
-                            if not suppress_subprocess_output:
-                                print(f"Extracted geometry center: {geometry_center}")
-                            break 
-                        except Exception as e:
-                            if not suppress_subprocess_output:
-                                print(f"⚠️ Could not parse geometry center from line: {line} - Error: {e}")
-            if process_result.stderr and not suppress_subprocess_output:
-                print(process_result.stderr, file=sys.stderr)
-
-
-        except subprocess.CalledProcessError as e:
-            print(f"\\n❌ FreeCAD rotation failed for angle {angle}")
-            print(f"Command: {e.cmd}")
-            print(f"Exit code: {e.returncode}")
-            if e.stdout: # Changed from e.output to e.stdout
-                print("Stdout:\\n", e.stdout)
-            if e.stderr: # Added stderr printing
-                print("Stderr:\\n", e.stderr)
-            sys.exit(1)
-
-        freecad_end_time = time.time()
-        script_timings[f"freecad_rotation_angle_{angle}_vel_{velocity}"] = freecad_end_time - freecad_start_time
-        if geometry_center:
-            script_timings[f"geometry_center_angle_{angle}_vel_{velocity}"] = geometry_center
-
-
-        # Run OpenFOAM commands
-        openfoam_start_time = time.time()
-        bash_cmd = f"""
-        source /usr/lib/openfoam/openfoam2412/etc/bashrc
-        cd {case_dir}
-        mkdir -p 0 # Use -p to avoid error if exists, though 0.orig is copied next
-        cp -r 0.orig/* 0
-        blockMesh
-        surfaceFeatureExtract
-        snappyHexMesh -overwrite
-        simpleFoam
-        touch case.foam
-        exit
-        """
-        subprocess.run(["bash", "-c", bash_cmd], check=True, stdout=subprocess.DEVNULL if suppress_subprocess_output else None, stderr=subprocess.DEVNULL if suppress_subprocess_output else None)
-        openfoam_end_time = time.time()
-        script_timings[f"openfoam_simulation_angle_{angle}_vel_{velocity}"] = openfoam_end_time - openfoam_start_time
+        except OSError as e:
+            raise RuntimeError(f"Could not start the ParaView slice server (pvpython {SLICE_SCRIPT} --server): {e}") from e
+    return _paraview_server
+
+
+def export_slice(case_foam_path: Path, csv_slice_path: Path, suppress_subprocess_output: bool):
+    """
+    Exports the Z slice of a case with the persistent pvpython slice server.
 
+    Each worker process starts its own server on its first export and keeps it
+    alive across cases, so the Python + ParaView startup is paid once per worker
+    instead of once per case, and not at all by the workers serving cases from
+    the angle cache. The server exits on its own when the worker process (and so
+    its stdin) goes away.
+
+    Args:
+        case_foam_path: Path to the `case.foam` file of the case.
+        csv_slice_path: Path of the slice file to write (`.npz` or CSV, see `slice_and_export.py`).
+        suppress_subprocess_output: Whether to silence ParaView's output.
+    """
+    server = _get_paraview_server(suppress_subprocess_output)
+    server.stdin.write(json.dumps([str(case_foam_path), str(csv_slice_path)]) + "\n")
+    server.stdin.flush()
+    for line in server.stdout:
+        if line.startswith("SLICE_DONE"):
+            return
+        if line.startswith("SLICE_ERROR:"):
+            raise RuntimeError(f"ParaView slice export failed for {case_foam_path}: {line[len('SLICE_ERROR:'):].strip()}")
+        if not suppress_subprocess_output:
+            print(line, end="") # ParaView's own output
+    raise RuntimeError(f"ParaView slice server exited with code {server.wait()} while exporting {case_foam_path}")
+
+
+def case_dir_name(angle: float, velocity: float) -> str:
+    """Name of the case directory (and of the processed dataset directory) of an angle-velocity pair."""
+    # Round angle and velocity for directory naming to avoid overly long/precise float names
+    # You can adjust the precision as needed
+    return f"case_angle_{round(angle, 2)}_vel_{round(velocity, 2)}"
+
+
+class CaseTask(NamedTuple):
+    """An angle-velocity pair of the sweep along with its directories, computed once before dispatch."""
+    angle: float
+    velocity: float
+    case_dir: Path # OpenFOAM case directory, removed once the case is processed
+    processed_dir: Path # Dataset directory of the case
+
+
+class CaseSettings(NamedTuple):
+    """Settings of a sweep the processed cases and cached slices depend on, passed as one value."""
+    residual_tolerance: float = None # Linear solver tolerance (see `apply_solver_settings`), None for the base case value
+    max_iters: int = None # Maximum number of SIMPLE iterations (see `apply_solver_settings`), None for the base case value
+    insitu_slice: bool = False # Whether the solver writes the slice itself (see `add_insitu_slice`)
+    reuse_angle_cache: bool = False # Whether the cases of an angle share its cached slice (see `save_angle_cache`)
+
+
+def build_case_tasks(angle_velocity_pairs) -> list:
+    """Builds the `CaseTask` table of the sweep from its angle-velocity pairs."""
+    tasks = []
+    for angle, velocity in angle_velocity_pairs:
+        name = case_dir_name(angle, velocity)
+        tasks.append(CaseTask(angle, velocity, CASES_SCRATCH_DIR / name, DATASET_PROCESSED_DIR / name))
+    return tasks
+
+
+def prepare_case(task: CaseTask, background_mesh_path: Path = None, settings: CaseSettings = CaseSettings()) -> Path:
+    """
+    Provisions the case directory of an angle-velocity pair and sets its inlet velocity.
+
+    Args:
+        task: The case to provision.
+        background_mesh_path: `polyMesh` built by `build_background_mesh`, copied into the
+            case since snappyHexMesh overwrites it. None to leave it to blockMesh in the
+            case (see `build_openfoam_cmd`).
+        settings: Solver settings and slice source of the sweep.
+
+    Returns:
+        Path to the case directory.
+    """
+    case_dir = task.case_dir
+
+    # Provision the case from the base case
+    if case_dir.exists():
+        shutil.rmtree(case_dir)
+    provision_case(BASE_CASE, case_dir)
+    if background_mesh_path is not None:
+        polymesh_dir = case_dir / "constant" / "polyMesh"
+        # Left by provision_case's full-copy fallback: cp would copy the mesh into it
+        if polymesh_dir.is_symlink():
+            polymesh_dir.unlink()
+        elif polymesh_dir.exists():
+            shutil.rmtree(polymesh_dir)
+        clone_base_case(background_mesh_path, polymesh_dir)
+    apply_solver_settings(case_dir, settings.residual_tolerance, settings.max_iters)
+    limit_written_time_steps(case_dir)
+    configure_parallel_run(case_dir, OPENFOAM_PROCS)
+    if settings.insitu_slice:
+        add_insitu_slice(case_dir)
+
+    # Update inlet velocity in the U file
+    try:
+        u_file_relative_path, u_template = load_inlet_velocity_template(BASE_CASE)
+    except OSError as e:
+        print(f"❌ Error: U file not found in {BASE_CASE / '0.orig'}: {e}")
+        sys.exit(1)
+    update_inlet_velocity(case_dir, task.velocity, u_template, u_file_relative_path)
+    return case_dir
+
+
+def rotation_entry(task: CaseTask) -> dict:
+    """Rotation of a provisioned case, as expected by `rotate_geometries`."""
+    return {
+        "angle": task.angle,
+        "output": str(task.case_dir / "constant/triSurface/buildings.stl"),
+        "snappy": str(task.case_dir / "system/snappyHexMeshDict"),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def load_base_geometry() -> np.ndarray:
+    """Triangles of the base geometry, parsed once per process (see `rotate_stl.load_stl`)."""
+    try:
+        return load_stl(BASE_GEOMETRY)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: could not read the base geometry {BASE_GEOMETRY}: {e}")
+        sys.exit(1)
+
+
+def base_geometry_center(suppress_subprocess_output: bool) -> dict:
+    """Center of the base geometry bounding box as a dict with keys x, y, z."""
+    geometry_center = stl_geometry_center(load_base_geometry())
+    if not suppress_subprocess_output:
+        print(f"Extracted geometry center: {geometry_center}")
+    return geometry_center
+
+
+def rotate_geometries(rotation_entries: list, suppress_subprocess_output: bool):
+    """
+    Rotates the base geometry for the given cases, in process.
+
+    The base STL is parsed once per process (see `load_base_geometry`) and each
+    entry gets its rotated STL and refinement box (see `rotate_stl.py`), which
+    is a matrix product on the vertices instead of a FreeCAD startup.
+
+    Args:
+        rotation_entries: One dict per case with the `angle` in degrees, the `output`
+            STL path and the `snappy` snappyHexMeshDict path.
+        suppress_subprocess_output: Whether to silence the progress messages.
+    """
+    rotate_batch(load_base_geometry(), rotation_entries, verbose=not suppress_subprocess_output)
+
+
+TIMINGS_FLUSH_EVERY = 5 # Cases between two writes of script_timings.json during the sweep
+FINGERPRINT_FILE_NAME = ".fingerprint.json"
+
+
+def case_fingerprint(angle: float, velocity: float, settings: CaseSettings = CaseSettings(),
+                     from_angle_cache: bool = False) -> dict:
+    """
+    Inputs a processed case depends on: base case and geometry modification times,
+    angle, velocity, solver settings (see `apply_solver_settings`, None for the base
+    case values), whether the solver wrote the slice itself and whether the case
+    was scaled from the cached slice of its angle instead of solved (see `save_angle_cache`).
+    """
+    return {
+        "base_mtime": BASE_CASE.stat().st_mtime_ns,
+        "geometry_mtime": BASE_GEOMETRY.stat().st_mtime_ns,
+        "angle": angle,
+        "velocity": velocity,
+        "residual_tolerance": settings.residual_tolerance,
+        "max_iters": settings.max_iters,
+        "insitu_slice": settings.insitu_slice,
+        "from_angle_cache": from_angle_cache,
+    }
+
+
+ANGLE_CACHE_DIR = OUTPUT_DIR / "cache"
+
+
+def angle_cache_path(angle: float) -> Path:
+    """Slice cache file of an angle, shared by the angles equal to 0.1° (see `save_angle_cache`)."""
+    return ANGLE_CACHE_DIR / f"angle_{round(angle, 1)}.npz"
+
+
+def read_angle_cache(angle: float, settings: CaseSettings = CaseSettings()):
+    """
+    Returns the inlet velocity of the cached slice of an angle, or None if there is
+    none for the current inputs, solver settings and slice source (see `case_fingerprint`).
+    """
+    fingerprint = case_fingerprint(angle, None, settings)
+    try:
+        with np.load(angle_cache_path(angle)) as cache:
+            cached_tolerance = float(cache['residual_tolerance'])
+            cached_max_iters = int(cache['max_iters'])
+            if (int(cache['base_mtime']) != fingerprint['base_mtime']
+                    or int(cache['geometry_mtime']) != fingerprint['geometry_mtime']
+                    or (None if np.isnan(cached_tolerance) else cached_tolerance) != fingerprint['residual_tolerance']
+                    or (None if cached_max_iters < 0 else cached_max_iters) != fingerprint['max_iters']
+                    or bool(cache['insitu_slice']) != fingerprint['insitu_slice']):
+                return None
+            return float(cache['velocity_mps'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_angle_cache(angle: float, velocity: float, slice_path: Path, settings: CaseSettings = CaseSettings()):
+    """
+    Caches the slice of a solved case for `--reuse-angle-cache`.
+
+    The other cases at the same angle (to 0.1°), in this sweep or the next ones,
+    reuse it for any velocity (see `group_tasks_by_angle`),
+    skipping the rotation, OpenFOAM and ParaView, with the velocities scaled by
+    `velocity / cached_velocity`. This assumes the flow is linear in the inlet
+    velocity, which holds for potential / low-Re flows and only approximately
+    for the RANS solutions of simpleFoam (the wake shape varies with Re). The
+    slice is stored with `read_slice`'s `.npz` layout, along with the inputs and
+    solver settings it was computed with (NaN tolerance and -1 iterations for the
+    base case values).
+    """
+    fingerprint = case_fingerprint(angle, velocity, settings)
+    df = read_slice(slice_path)
+    cache_path = angle_cache_path(angle)
+    tmp_path = cache_path.with_suffix(".npz.tmp")
+    with open(tmp_path, 'wb') as f_cache:
+        np.savez(
+            f_cache, points=df[['x', 'y']].to_numpy(), U=df[['ux', 'uy']].to_numpy(),
+            velocity_mps=velocity, base_mtime=fingerprint['base_mtime'], geometry_mtime=fingerprint['geometry_mtime'],
+            residual_tolerance=np.nan if settings.residual_tolerance is None else settings.residual_tolerance,
+            max_iters=-1 if settings.max_iters is None else settings.max_iters, insitu_slice=settings.insitu_slice
+        )
+    os.replace(tmp_path, cache_path) # Atomic: concurrent cases may cache the same angle
+
+
+def group_tasks_by_angle(tasks: list, settings: CaseSettings = CaseSettings()):
+    """
+    Splits the cases of a `--reuse-angle-cache` sweep by angle (to 0.1°, see `angle_cache_path`).
+
+    A cached slice is only valid for the solver settings and slice source of the
+    sweep (see `read_angle_cache`).
+
+    Returns:
+        - The cases to simulate: the first case of every angle without a valid cached slice.
+        - The cases served by a slice already cached by a previous sweep.
+        - The cases served by the slice their angle's simulated case caches in
+          this sweep, to run once it is done.
+    """
+    tasks_to_simulate, cached_tasks, waiting_tasks = [], [], []
+    simulated_angles = set()
+    for task in tasks:
+        angle_key = round(task.angle, 1)
+        if angle_key in simulated_angles:
+            waiting_tasks.append(task)
+        elif read_angle_cache(task.angle, settings) is not None:
+            cached_tasks.append(task)
+        else:
+            simulated_angles.add(angle_key)
+            tasks_to_simulate.append(task)
+    return tasks_to_simulate, cached_tasks, waiting_tasks
+
+
+def is_case_done(task: CaseTask, settings: CaseSettings = CaseSettings()) -> bool:
+    """
+    Tells whether a previous run already produced the dataset files of a case.
+
+    The fingerprint is written next to the dataset files once they are all saved,
+    and must match the current inputs, solver settings included (a smoke run with
+    `--max-iters 5` is not a completed case for a full run). A case scaled from
+    the angle cache only counts as done for a `--reuse-angle-cache` sweep, any
+    other sweep solves it for real. Restarting an interrupted sweep thus costs a
+    few stat() calls per completed case.
+    """
+    fingerprint_path = task.processed_dir / FINGERPRINT_FILE_NAME
+    try:
+        with open(fingerprint_path) as f_fingerprint:
+            stored = json.load(f_fingerprint)
+        from_angle_cache = settings.reuse_angle_cache and stored.get("from_angle_cache") is True
+        expected = case_fingerprint(task.angle, task.velocity, settings, from_angle_cache)
+        return stored == expected
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def simulate_case(task: CaseTask, suppress_subprocess_output: bool, settings: CaseSettings, case_timings: dict,
+                  block_mesh: bool = False) -> Path:
+    """
+    Runs the OpenFOAM simulation of an already provisioned and rotated case and exports its slice.
+
+    Args:
+        task: The case to simulate.
+        suppress_subprocess_output: Whether to silence subprocesses and progress messages.
+        settings: Settings of the sweep; with `insitu_slice`, the solver writes the slice itself,
+            skipping the ParaView export.
+        case_timings: Timings of the case, completed with the OpenFOAM and ParaView steps.
+        block_mesh: Whether the case has no background mesh yet (see `build_openfoam_cmd`).
+
+    Returns:
+        Path to the slice file (may not exist if a step failed to write it).
+    """
+    case_dir = task.case_dir
+
+    # Run OpenFOAM commands
+    openfoam_start_time = time.time()
+    if OPENFOAM_PROCS > 1:
+        write_decompose_par_dict(case_dir, OPENFOAM_PROCS)
+    bash_cmd = build_openfoam_cmd(case_dir, OPENFOAM_PROCS, block_mesh)
+    run_openfoam_bash(bash_cmd, suppress_subprocess_output)
+    openfoam_end_time = time.time()
+    case_timings["openfoam_simulation"] = openfoam_end_time - openfoam_start_time
+    try:
+        case_timings.update(read_step_timings(case_dir))
+    except (OSError, ValueError) as e:
+        if not suppress_subprocess_output:
+            print(f"⚠️ Could not read the OpenFOAM step timings of {case_dir}: {e}")
+
+    if settings.insitu_slice:
+        # The slice was written by simpleFoam, reported as a missing file below if not found
+        csv_slice_path = find_insitu_slice(case_dir) or case_dir / f"{INSITU_SLICE_FUNCTION_NAME}.raw"
+    else:
         # Export slice with ParaView
         paraview_start_time = time.time() # Timer for ParaView
-        csv_slice_path = case_dir / "slice.csv"
-        subprocess.run([
-            "pvpython", str(slice_script),
-            str(case_dir / "case.foam"),
-            str(csv_slice_path) # Use variable for csv path
-        ], check=True, stdout=subprocess.DEVNULL if suppress_subprocess_output else None, stderr=subprocess.DEVNULL if suppress_subprocess_output else None)
+        csv_slice_path = case_dir / "slice.npz"
+        export_slice(case_dir / "case.foam", csv_slice_path, suppress_subprocess_output)
         paraview_end_time = time.time() # End timer for ParaView
-        script_timings[f"paraview_slice_export_angle_{angle}_vel_{velocity}"] = paraview_end_time - paraview_start_time # Store ParaView timing
+        case_timings["paraview_slice_export"] = paraview_end_time - paraview_start_time # Store ParaView timing
+    return csv_slice_path
+
+
+def run_one_case(task: CaseTask, geometry_center, suppress_subprocess_output: bool,
+                 settings: CaseSettings = CaseSettings(), from_angle_cache: bool = False, fast_png: bool = False,
+                 background_mesh_path: Path = None) -> dict:
+    """
+    Processes a single angle-velocity combination.
+
+    Provisions and rotates the case (see `prepare_case`), runs its OpenFOAM
+    simulation and exports the slice with ParaView (see `simulate_case`), or
+    takes the cached slice of its angle, and generates the dataset files. The
+    case is provisioned here rather than before dispatch, so the scratch space
+    holds only the cases running at a time. The case directory is left for
+    `remove_case_dir`. Every case works in its own `case_dir`, so cases can run
+    concurrently in separate processes.
+
+    Args:
+        task: The case to process.
+        geometry_center: Center of the geometry as returned by `base_geometry_center`.
+        suppress_subprocess_output: Whether to silence subprocesses and progress messages.
+        settings: Solver settings and slice source of the sweep, recorded in the fingerprint and
+            the angle cache. With `reuse_angle_cache`, the slice of the case is cached for its
+            angle (see `save_angle_cache`).
+        from_angle_cache: Whether to use the cached slice of the angle instead of simulating
+            the case, which is then not provisioned. If the slice is missing or stale when
+            the case runs, the case is simulated instead.
+        fast_png: Whether to rasterise the `_visu.png` preview directly (see
+            `visualize_wind_map.save_png_fast`) instead of exporting the Plotly figure.
+        background_mesh_path: `polyMesh` built by `build_background_mesh`, None to run
+            blockMesh in the case.
+
+    Returns:
+        The timings recorded for this case, by step.
+    """
+    case_timings = {} # To store timings of this case
+    angle, velocity, case_dir, case_specific_dir = task
+    velocity_scale = 1.0
+
+    # Checked again here: the cache may have been removed or invalidated since the dispatch,
+    # or the simulated case of the angle may have failed to write it
+    cached_velocity = read_angle_cache(angle, settings) if from_angle_cache else None
+    scaled_from_cache = bool(cached_velocity)
+    if scaled_from_cache:
+        csv_slice_path = angle_cache_path(angle)
+        velocity_scale = velocity / cached_velocity
+        case_timings["angle_cache_velocity_scale"] = velocity_scale
+    else:
+        if from_angle_cache and not suppress_subprocess_output:
+            print(f"⚠️ No valid cached slice for angle {angle}, simulating the case instead.")
+        prepare_case(task, background_mesh_path, settings)
+        rotation_start_time = time.time() # Timer for the rotation
+        rotate_geometries([rotation_entry(task)], suppress_subprocess_output)
+        case_timings["geometry_rotation"] = time.time() - rotation_start_time
+        csv_slice_path = simulate_case(task, suppress_subprocess_output, settings, case_timings,
+                                       block_mesh=background_mesh_path is None)
+        if settings.reuse_angle_cache and csv_slice_path.exists():
+            save_angle_cache(angle, velocity, csv_slice_path, settings)
+
+    # Generate and save wind map visualization
+    if geometry_center and csv_slice_path.exists():
+        if not suppress_subprocess_output:
+            print(f"🔄 Generating visualization for angle {angle}, velocity {velocity}...")
+        try:
+            # Utiliser les coordonnées x, y du centre extraites (ignorer z pour la 2D)
+            center_2d_visualization = (geometry_center['x'], geometry_center['y'])
+            # Only interpolate the disc swept by the rotated crop around the center
+            crop_roi = (center_2d_visualization, float(np.hypot(*CROP_SIZE_VISUALIZATION)) / 2)
+            x_vec, y_vec, ux_grid, uy_grid = load_and_interpolate(csv_slice_path, velocity_scale=velocity_scale, roi=crop_roi)
+
+            ux_crop, uy_crop = extract_rotated_crop(
+                x_vec, y_vec,
+                ux_grid, uy_grid,
+                center_2d_visualization,
+                CROP_SIZE_VISUALIZATION,
+                angle, # Utiliser l\'angle de rotation actuel de la géométrie
+                output_res=OUTPUT_RESOLUTION_VISUALIZATION
+            )
+
+            # Ensure the case-specific directory exists
+            case_specific_dir.mkdir(parents=True, exist_ok=True)
+
+            # Define the prefix for the output files within the case-specific directory
+            save_prefix_path = case_specific_dir / "wind_data"
+
+            plot_ux_uy(
+                ux_crop, uy_crop, angle,
+                save_path=str(save_prefix_path)+"_visu.png", # Save the plot as a PNG
+                fast=fast_png # Rasterised without Plotly/Kaleido with --fast-png
+            ) # Commented out as per discussion, focus on .npy and .json for dataset
+
+            # Export the simulated (Ux_sim, Uy_sim) and incident (Ux_incident, Uy_incident) wind data
+            # arrays with the metadata (angle, velocity and angle cache scaling) to a single compressed wind_data.npz
+            # Use the original, non-rounded angle and velocity for metadata accuracy
+            export_dataset_arrays(ux_crop, uy_crop, float(velocity), float(angle), save_prefix_path,
+                                  velocity_scale=velocity_scale if scaled_from_cache else None)
+
+            # Written last: marks the case as complete for the next runs
+            with open(case_specific_dir / FINGERPRINT_FILE_NAME, 'w') as f_fingerprint:
+                json.dump(case_fingerprint(angle, velocity, settings, scaled_from_cache), f_fingerprint)
 
-        # Generate and save wind map visualization
-        if geometry_center and csv_slice_path.exists():
             if not suppress_subprocess_output:
-                print(f"🔄 Generating visualization for angle {angle}, velocity {velocity}...")
-            try:
-                x_vec, y_vec, ux_grid, uy_grid = load_and_interpolate(csv_slice_path)
-                # Utiliser les coordonnées x, y du centre extraites (ignorer z pour la 2D)
-                center_2d_visualization = (geometry_center['x'], geometry_center['y'])
-                
-                ux_crop, uy_crop = extract_rotated_crop(
-                    x_vec, y_vec, 
-                    ux_grid, uy_grid, 
-                    center_2d_visualization, 
-                    crop_size_visualization, 
-                    angle, # Utiliser l\'angle de rotation actuel de la géométrie
-                    output_res=output_resolution_visualization
-                )
-                
-                # Define the case-specific directory and ensure it exists
-                case_specific_dir = dataset_processed_dir / f"case_angle_{angle_for_naming}_vel_{velocity_for_naming}"
-                case_specific_dir.mkdir(parents=True, exist_ok=True)
-
-                # Define the prefix for the output files within the case-specific directory
-                save_prefix_path = case_specific_dir / "wind_data"
-                
-                plot_ux_uy(
-                    ux_crop, uy_crop, angle,
-                    save_path=str(save_prefix_path)+"_visu.png" # Save the plot as a PNG
-                ) # Commented out as per discussion, focus on .npy and .json for dataset
-
-                # Export simulated wind data arrays (Ux_sim, Uy_sim)
-                save_heatmap_cv2(
-                    ux_crop, str(save_prefix_path)+"_ux_sim.png", vmin=vmin_scale, vmax=vmax_scale)
-                save_heatmap_cv2(
-                    uy_crop, str(save_prefix_path)+"_uy_sim.png", vmin=vmin_scale, vmax=vmax_scale)
-
-                # Export incident wind data arrays (Ux_incident, Uy_incident)
-                theta_rad = np.deg2rad(angle)
-
-                ux_val = velocity * np.cos(theta_rad)
-                uy_val = -velocity * np.sin(theta_rad)
-
-                incident_ux = np.full(output_resolution_visualization, ux_val, dtype=np.float32)
-                incident_uy = np.full(output_resolution_visualization, uy_val, dtype=np.float32)
-
-                save_heatmap_cv2(incident_ux, f"{save_prefix_path}_ux_incident.png", vmin=vmin_scale, vmax=vmax_scale)
-                save_heatmap_cv2(incident_uy, f"{save_prefix_path}_uy_incident.png", vmin=vmin_scale, vmax=vmax_scale)
-
-                # Save metadata (angle and velocity) to a JSON file
-                # Use the original, non-rounded angle and velocity for metadata accuracy
-                metadata = {"angle_deg": float(angle), "velocity_mps": float(velocity)}
-                metadata_save_path = Path(f"{str(save_prefix_path)}_metadata.json") # Path will be case_specific_dir / "wind_data_metadata.json"
-                with open(metadata_save_path, 'w') as f_meta:
-                    json.dump(metadata, f_meta, indent=4)
-
-                if not suppress_subprocess_output:
-                    print(f"✅ Successfully saved 4 data arrays and 1 metadata JSON for angle {angle}, velocity {velocity} to {case_specific_dir}")
-            except Exception as e:
-                if not suppress_subprocess_output:
-                    print(f"❌ Failed to save one or more data arrays for angle {angle}, velocity {velocity}: {e}")
-        elif not geometry_center and not suppress_subprocess_output:
-            print(f"⚠️ Skipping visualization for angle {angle}, velocity {velocity} due to missing geometry center.")
-        elif not csv_slice_path.exists() and not suppress_subprocess_output:
-            print(f"⚠️ Skipping visualization for angle {angle}, velocity {velocity} due to missing CSV slice file: {csv_slice_path}")
-
-        # Clean up the case directory to save space
-        if case_dir.exists():
+                print(f"✅ Successfully saved 4 data arrays and their metadata for angle {angle}, velocity {velocity} to {save_prefix_path}.npz")
+        except Exception as e:
             if not suppress_subprocess_output:
-                print(f"🧹 Cleaning up case directory: {case_dir}")
-            try:
-                shutil.rmtree(case_dir)
-                if not suppress_subprocess_output:
-                    print(f"✅ Successfully removed {case_dir}")
-            except Exception as e:
-                if not suppress_subprocess_output:
-                    print(f"❌ Failed to remove {case_dir}: {e}")
-        elif not suppress_subprocess_output:
-            print(f"ℹ️ Case directory {case_dir} not found for cleanup (already removed or never created).")
+                print(f"❌ Failed to save one or more data arrays for angle {angle}, velocity {velocity}: {e}")
+    elif not geometry_center and not suppress_subprocess_output:
+        print(f"⚠️ Skipping visualization for angle {angle}, velocity {velocity} due to missing geometry center.")
+    elif not csv_slice_path.exists() and not suppress_subprocess_output:
+        print(f"⚠️ Skipping visualization for angle {angle}, velocity {velocity} due to missing slice file: {csv_slice_path}")
+
+    return case_timings
+
+
+def remove_case_dir(case_dir: Path, suppress_subprocess_output: bool):
+    """
+    Removes a processed case directory to save space.
+
+    Meant to run in a background thread of the main process (see `main_script_logic`),
+    so that deleting the tens of thousands of files of a meshed case overlaps the
+    next OpenFOAM runs instead of stalling a worker.
+    """
+    if case_dir.exists():
+        if not suppress_subprocess_output:
+            print(f"🧹 Cleaning up case directory: {case_dir}")
+        try:
+            shutil.rmtree(case_dir)
+            if not suppress_subprocess_output:
+                print(f"✅ Successfully removed {case_dir}")
+        except Exception as e:
+            if not suppress_subprocess_output:
+                print(f"❌ Failed to remove {case_dir}: {e}")
+    elif not suppress_subprocess_output:
+        print(f"ℹ️ Case directory {case_dir} not found for cleanup (already removed or never created).")
+
+
+def sample_angle_velocity_pairs(nb_couples: int, sampling: str = "sobol", seed: int = None) -> list:
+    """
+    Draws the angle-velocity pairs of the sweep in [ANGLE_MIN_DEG, ANGLE_MAX_DEG) x [VELOCITY_MIN_MPS, VELOCITY_MAX_MPS).
+
+    "sobol" uses a scrambled Sobol sequence, which covers the rectangle evenly
+    (no clusters nor gaps) and so needs fewer cases for the same coverage than
+    "random" uniform draws. The angle axis is periodic, mapping [0, 1) linearly
+    onto a full turn keeps that coverage across 0/360°. Sobol points are best
+    balanced when `nb_couples` is a power of 2.
+
+    Args:
+        nb_couples: Number of pairs to draw.
+        sampling: "sobol" or "random".
+        seed: Seed of the sampler, None for a random one.
+
+    Returns:
+        The list of (angle, velocity) pairs.
+    """
+    if sampling == "sobol":
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning) # Balance warning when nb_couples is not a power of 2
+            unit_samples = qmc.Sobol(d=2, seed=seed).random(nb_couples)
+    else:
+        unit_samples = np.random.default_rng(seed).random((nb_couples, 2))
+    angles = ANGLE_MIN_DEG + unit_samples[:, 0] * (ANGLE_MAX_DEG - ANGLE_MIN_DEG)
+    velocities = VELOCITY_MIN_MPS + unit_samples[:, 1] * (VELOCITY_MAX_MPS - VELOCITY_MIN_MPS)
+    return list(zip(angles.tolist(), velocities.tolist()))
+
+
+SWEEP_PAIRS_FILE = OUTPUT_DIR / "sweep_pairs.json" # Pairs of the current sweep, reused on restart until done
+
+
+def load_or_sample_pairs(nb_couples: int, sampling: str = "sobol", seed: int = None,
+                         settings: CaseSettings = CaseSettings()) -> list:
+    """
+    Returns the angle-velocity pairs of the sweep, reusing those of an unfinished previous run.
+
+    The case directories and fingerprints are keyed by the exact pairs, so a
+    restarted sweep only resumes if it draws the same ones. The pairs are kept
+    in SWEEP_PAIRS_FILE with the sampling parameters, and reused when the
+    number of pairs and the sampling match and either `seed` is equal to the
+    stored seed, or `seed` is None and at least one of their cases is not done
+    (see `is_case_done`, which `settings` are passed to). Otherwise (or
+    on the first run) they are drawn with `sample_angle_velocity_pairs`; without
+    a seed, a random one is drawn and stored, and the file is replaced. Rerunning
+    a finished sweep without --seed thus adds new cases to the dataset.
+    """
+    if SWEEP_PAIRS_FILE.exists():
+        with open(SWEEP_PAIRS_FILE) as f:
+            stored = json.load(f)
+        if stored.get("nb_couples") == nb_couples and stored.get("sampling") == sampling:
+            pairs = [tuple(pair) for pair in stored["pairs"]]
+            if seed is not None and stored.get("seed") == seed:
+                return pairs
+            if seed is None and not all(
+                is_case_done(task, settings) for task in build_case_tasks(pairs)
+            ):
+                return pairs
+
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    pairs = sample_angle_velocity_pairs(nb_couples, sampling, seed)
+    write_json_atomic(SWEEP_PAIRS_FILE, {"nb_couples": nb_couples, "sampling": sampling, "seed": seed, "pairs": pairs})
+    return pairs
+
+
+def write_json_atomic(json_path: Path, data):
+    """
+    Writes a JSON file through a temporary file renamed over it.
+
+    `os.replace` is atomic, so readers (or a rerun after a crash) see either the
+    previous or the new content, never a truncated file.
+    """
+    tmp_path = json_path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, json_path)
+
+
+def load_previous_case_timings(timings_file_path: Path, tasks: list) -> list:
+    """
+    Returns the case records of a previous run's script_timings.json, except those of `tasks`.
+
+    A restarted sweep thus keeps the timings (and angle cache scaling) of the
+    cases processed before, while the cases it processes again get a new record.
+    """
+    try:
+        with open(timings_file_path) as f_timings:
+            previous_cases = json.load(f_timings).get("cases", [])
+    except (OSError, ValueError, AttributeError):
+        return []
+    rerun_pairs = {(task.angle, task.velocity) for task in tasks}
+    return [
+        record for record in previous_cases
+        if isinstance(record, dict) and (record.get("angle"), record.get("velocity")) not in rerun_pairs
+    ]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parses the command line arguments of the script."""
+    parser = argparse.ArgumentParser(description="Generates a wind simulation dataset with OpenFOAM and ParaView.")
+    parser.add_argument("--suppress-output", action="store_true",
+                        help="Hide the subprocess outputs for a cleaner progress bar.")
+    parser.add_argument("--insitu-slice", action="store_true",
+                        help="Let simpleFoam write the slice instead of exporting it with ParaView.")
+    parser.add_argument("--sampling", choices=("sobol", "random"), default="sobol",
+                        help="Sampling of the angle-velocity pairs: quasi-random Sobol (even coverage) or uniform random.")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed of the angle-velocity sampling, for a reproducible dataset. Restarts resume "
+                             "the pairs stored in sweep_pairs.json when the seed is equal to the stored one, or "
+                             "omitted while some of their cases are not done; otherwise new pairs are drawn "
+                             "(default: random seed, stored for restarts).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of cases run concurrently (default: cores // OPENFOAM_PROCS).")
+    parser.add_argument("--reuse-angle-cache", action="store_true",
+                        help="Cache the slice of each solved angle and reuse it, scaled by the inlet velocity, "
+                             "for the cases at the same angle (to 0.1°). Assumes the flow is linear in the velocity.")
+    parser.add_argument("--residual-tolerance", type=float, default=None,
+                        help="Tolerance of the simpleFoam linear solvers, e.g. 1e-4 (default: base case value).")
+    parser.add_argument("--max-iters", type=int, default=None,
+                        help="Maximum number of simpleFoam iterations (default: base case endTime).")
+    parser.add_argument("--fast-png", action="store_true",
+                        help="Write the _visu.png previews as raw Ux | Uy colour maps with Pillow, without "
+                             "titles nor colorbars, instead of the Plotly figure (skips Kaleido/Chromium).")
+    return parser.parse_args(argv)
+
+
+def remove_scratch_dirs(tasks: list):
+    """
+    Removes the case directories of `tasks` and the background mesh left in `CASES_SCRATCH_DIR`.
+
+    The processed cases are already removed by `remove_case_dir` as their results
+    come in; this catches the cases a worker provisioned but did not finish when
+    the sweep stops on an exception or Ctrl-C, which would otherwise fill `/dev/shm`.
+    The background mesh is kept until then, since the workers copy it into their cases.
+    """
+    for case_dir in [task.case_dir for task in tasks] + [BACKGROUND_MESH_DIR]:
+        shutil.rmtree(case_dir, ignore_errors=True)
+    if CASES_SCRATCH_DIR != OUTPUT_DIR:
+        try:
+            CASES_SCRATCH_DIR.rmdir() # Only if empty: another run may use the same OUTPUT_DIR
+        except OSError:
+            pass
+
+
+def main_script_logic():
+    """
+    Main logic for the dataset generation script.
+
+    Handles argument parsing (see `parse_args`), generates the angle-velocity
+    pairs and dispatches them to a pool of worker processes (see `run_one_case`),
+    each performing geometry rotation, OpenFOAM simulation and ParaView data
+    extraction for one case. It also times each significant operation and
+    saves these timings to a JSON file.
+    """
+    # === Script arguments ===
+    args = parse_args()
+    suppress_subprocess_output = args.suppress_output
+    insitu_slice = args.insitu_slice
+    settings = CaseSettings(args.residual_tolerance, args.max_iters, insitu_slice, args.reuse_angle_cache)
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    CASES_SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
+    # visualization_output_dir.mkdir(exist_ok=True) # Create visualization directory - Replaced
+    DATASET_PROCESSED_DIR.mkdir(exist_ok=True) # Create processed dataset directory
+
+    timings_file_path = OUTPUT_DIR / "script_timings.json"
+    total_script_start_time = time.time() # Start general timer
+
+    # Generate angle-velocity pairs (reproducible with --seed, reused from an unfinished previous run on restart)
+    angle_velocity_pairs = load_or_sample_pairs(NB_COUPLES, args.sampling, args.seed, settings)
+    tasks = build_case_tasks(angle_velocity_pairs)
+
+    # Skip the cases completed by a previous run
+    pending_tasks = [task for task in tasks if not is_case_done(task, settings)]
+    # To store timings, one {"angle": ..., "velocity": ..., step: duration} record per case,
+    # those of the cases processed by the previous runs included
+    script_timings = {"cases": load_previous_case_timings(timings_file_path, pending_tasks)}
+    if len(pending_tasks) < len(tasks) and not suppress_subprocess_output:
+        print(f"⏭️ Skipping {len(tasks) - len(pending_tasks)} case(s) already processed in {DATASET_PROCESSED_DIR}")
+
+    # With --reuse-angle-cache, one case per angle (to 0.1°) is simulated unless a previous sweep
+    # cached it, and the other cases at that angle are served from its cached slice
+    if args.reuse_angle_cache:
+        ANGLE_CACHE_DIR.mkdir(exist_ok=True)
+        tasks_to_simulate, cached_tasks, waiting_tasks = group_tasks_by_angle(pending_tasks, settings)
+    else:
+        tasks_to_simulate, cached_tasks, waiting_tasks = pending_tasks, [], []
+    if len(tasks_to_simulate) < len(pending_tasks) and not suppress_subprocess_output:
+        print(f"♻️ Reusing the cached slice of their angle for {len(pending_tasks) - len(tasks_to_simulate)} case(s)")
+    # The cases waiting for a slice cached by this sweep run once the simulated cases are done
+    dispatch_phases = [
+        (tasks_to_simulate + cached_tasks, [False] * len(tasks_to_simulate) + [True] * len(cached_tasks)),
+        (waiting_tasks, [True] * len(waiting_tasks)),
+    ]
+
+    # Fail early rather than in every worker, unless the solver writes the slices itself
+    if pending_tasks and not insitu_slice and shutil.which("pvpython") is None:
+        print("❌ Error: pvpython not found in PATH, needed to export the slices (or use --insitu-slice).")
+        sys.exit(1)
+
+    if pending_tasks:
+        # Removes what is left of the provisioned cases if the sweep fails or is interrupted
+        try:
+            # Background mesh shared by the cases, each provisioned and rotated by its worker
+            background_mesh_path = None
+            if tasks_to_simulate:
+                blockmesh_start_time = time.time() # Timer for the shared background mesh
+                background_mesh_path = build_background_mesh(suppress_subprocess_output)
+                script_timings["openfoam_blockmesh"] = time.time() - blockmesh_start_time
+            geometry_center = base_geometry_center(suppress_subprocess_output)
+            if geometry_center:
+                script_timings["geometry_center"] = geometry_center
+
+            # Every case writes to its own case_dir, so they are dispatched concurrently.
+            # One thread per MPI rank and per worker, inherited by the workers and their subprocesses,
+            # so that concurrent cases do not oversubscribe the cores
+            os.environ.setdefault("OMP_NUM_THREADS", "1")
+            # Use tqdm for the loop, disable if output is suppressed to avoid tqdm printing
+            # Processed case directories are deleted in the background, waited for on exit
+            with ProcessPoolExecutor(
+                max_workers=case_worker_count(len(pending_tasks), args.workers)
+            ) as executor, ThreadPoolExecutor(max_workers=2) as cleanup_pool, \
+                    tqdm(total=len(pending_tasks), desc="Processing angle/velocity combinations", disable=suppress_subprocess_output) as progress_bar:
+                try:
+                    for phase_tasks, from_angle_cache in dispatch_phases:
+                        case_results = executor.map(
+                            run_one_case, phase_tasks,
+                            itertools.repeat(geometry_center), itertools.repeat(suppress_subprocess_output),
+                            itertools.repeat(settings), from_angle_cache,
+                            itertools.repeat(args.fast_png), itertools.repeat(background_mesh_path)
+                        )
+                        for task, case_timings in zip(phase_tasks, case_results):
+                            script_timings["cases"].append({"angle": task.angle, "velocity": task.velocity, **case_timings})
+                            cleanup_pool.submit(remove_case_dir, task.case_dir, suppress_subprocess_output)
+                            progress_bar.update(1)
+                            if len(script_timings["cases"]) % TIMINGS_FLUSH_EVERY == 0:
+                                write_json_atomic(timings_file_path, script_timings) # Keeps a partial sweep queryable
+                except BaseException:
+                    # Drops the queued cases instead of running them all before the cleanup
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        finally:
+            remove_scratch_dirs(pending_tasks)
 
     total_script_end_time = time.time() # End general timer
     script_timings["total_script_duration"] = total_script_end_time - total_script_start_time # Store general timing
 
     # Save timings to a JSON file
-    timings_file_path = output_dir / "script_timings.json"
-    with open(timings_file_path, 'w') as f:
-        json.dump(script_timings, f, indent=4)
+    write_json_atomic(timings_file_path, script_timings)
 
     if not suppress_subprocess_output:
         print(f"Timings saved to {timings_file_path}")
@@ -1,90 +1,237 @@
 import sys
-import FreeCAD
-import Mesh
-from FreeCAD import Base
 import math
 from pathlib import Path
 import re
-
-def update_refinement_box(stl_path: Path, snappy_path: Path, margin=0.1, zmin=0.0, zmax=85):
-    mesh = Mesh.Mesh(str(stl_path))
-    bbox = mesh.BoundBox
-
-    dx = bbox.XMax - bbox.XMin
-    dy = bbox.YMax - bbox.YMin
+import json
+import numpy as np
+
+# Enregistrement d'un triangle d'un STL binaire : normale, 3 sommets, attribut
+STL_RECORD_DTYPE = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+STL_HEADER_SIZE = 84 # En-tête de 80 octets + nombre de triangles (uint32)
+_STL_VERTEX_RE = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+
+
+def load_stl(stl_path: Path) -> np.ndarray:
+    """Lit un STL binaire ou ASCII et renvoie ses triangles, tableau (n, 3, 3) float32."""
+    file_size = Path(stl_path).stat().st_size
+    if file_size >= STL_HEADER_SIZE:
+        with open(stl_path, "rb") as f:
+            f.seek(80)
+            nb_triangles = int.from_bytes(f.read(4), "little")
+        if nb_triangles and file_size == STL_HEADER_SIZE + nb_triangles * STL_RECORD_DTYPE.itemsize:
+            # STL binaire : projeté en mémoire, seuls les sommets sont copiés (un seul passage)
+            records = np.memmap(stl_path, dtype=STL_RECORD_DTYPE, mode="r", offset=STL_HEADER_SIZE, shape=(nb_triangles,))
+            return np.ascontiguousarray(records["vertices"])
+    # STL ASCII : seuls les sommets sont lus, les normales sont recalculées à l'écriture
+    data = Path(stl_path).read_bytes()
+    vertices = np.array(_STL_VERTEX_RE.findall(data), dtype=np.bytes_).astype(np.float32)
+    return vertices.reshape(-1, 3, 3)
+
+
+def unit_normals(triangles: np.ndarray) -> np.ndarray:
+    """Normales unitaires (n, 3) des triangles (nulles pour les triangles dégénérés)."""
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    norms = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, norms, out=np.zeros_like(normals), where=norms > 0)
+
+
+def write_stl_records(records: np.ndarray, stl_path: Path):
+    """Écrit des enregistrements STL_RECORD_DTYPE dans un STL binaire, sans copie."""
+    with open(stl_path, "wb") as f:
+        f.write(b"rotate_stl.py".ljust(80, b" "))
+        f.write(len(records).to_bytes(4, "little"))
+        f.write(records.data)
+
+
+def save_stl(triangles: np.ndarray, stl_path: Path):
+    """Écrit des triangles (n, 3, 3) dans un STL binaire, avec leurs normales."""
+    records = np.zeros(len(triangles), dtype=STL_RECORD_DTYPE)
+    records["vertices"] = triangles
+    records["normal"] = unit_normals(triangles)
+    write_stl_records(records, stl_path)
+
+
+def bounding_box(triangles: np.ndarray):
+    """Renvoie les coins (min, max) de la bounding box des triangles (sans copie, même pour une vue non contiguë)."""
+    return triangles.min(axis=(0, 1)), triangles.max(axis=(0, 1))
+
+
+def geometry_center(triangles: np.ndarray) -> dict:
+    """Centre 3D de la bounding box, au format {"x": ..., "y": ..., "z": ...}."""
+    bbox_min, bbox_max = bounding_box(triangles)
+    cx, cy, cz = ((bbox_min + bbox_max) / 2).tolist()
+    return {"x": cx, "y": cy, "z": cz}
+
+
+def rotation_center_2d(triangles: np.ndarray) -> np.ndarray:
+    """Centre 2D (x, y) de la bounding box, autour duquel les rotations sont appliquées."""
+    bbox_min, bbox_max = bounding_box(triangles)
+    return ((bbox_min[:2] + bbox_max[:2]) / 2).astype(np.float32)
+
+
+def rotation_matrix_2d(angle: float) -> np.ndarray:
+    """Matrice de rotation 2D float32 de `angle` degrés."""
+    r = math.radians(angle)
+    c, s = math.cos(r), math.sin(r)
+    return np.array([[c, -s], [s, c]], dtype=np.float32)
+
+
+def rotate_triangles(triangles: np.ndarray, angle: float, center_2d_for_rotation: np.ndarray = None, out: np.ndarray = None) -> np.ndarray:
+    """
+    Tourne les triangles de `angle` degrés autour de l'axe Z passant par le centre 2D de leur bounding box
+    (ou `center_2d_for_rotation`, calculé une fois pour tout un lot). Avec `out`, le résultat est écrit
+    dans ce tableau (n, 3, 3) float32, par ex. le champ "vertices" d'enregistrements réutilisés.
+    """
+    if center_2d_for_rotation is None:
+        center_2d_for_rotation = rotation_center_2d(triangles)
+    rotation_2d = rotation_matrix_2d(angle)
+    # Rotation autour de Z : z est inchangé, seules les colonnes x, y sont transformées.
+    # Translation -c, rotation et translation +c composées en une seule transformation affine :
+    # x' = R x + (c - R c), soit un produit matriciel suivi d'une addition en place.
+    offset = center_2d_for_rotation - rotation_2d @ center_2d_for_rotation
+    rotated = np.empty(np.shape(triangles), dtype=np.float32) if out is None else out
+    rotated[..., 2] = triangles[..., 2]
+    xy = np.matmul(triangles[..., :2], rotation_2d.T)
+    xy += offset
+    rotated[..., :2] = xy
+    return rotated
+
+
+def find_matching_brace(text: str, brace: int) -> int:
+    """
+    Renvoie l'indice de l'accolade fermante associée à l'accolade ouvrante `text[brace]`,
+    ou -1 si elle n'est pas fermée. Saut d'accolade en accolade (str.find) plutôt que
+    caractère par caractère, chaque accolade n'étant cherchée qu'une fois.
+    """
+    depth, position = 1, brace
+    next_open = text.find('{', brace + 1)
+    while depth:
+        next_close = text.find('}', position + 1)
+        if next_close == -1:
+            return -1
+        while next_open != -1 and next_open < next_close:
+            depth += 1
+            next_open = text.find('{', next_open + 1)
+        depth -= 1
+        position = next_close
+    return position
+
+
+def find_refinement_box(text: str):
+    """
+    Renvoie les bornes (début, fin) du bloc `refinementBox { ... }` de la section geometry,
+    c.-à-d. le premier qui déclare un `type` (celui de refinementRegions n'a que mode/levels),
+    ou None s'il n'y en a pas.
+    """
+    start = text.find('refinementBox')
+    while start != -1:
+        brace = start + len('refinementBox')
+        while brace < len(text) and text[brace].isspace():
+            brace += 1
+        if brace < len(text) and text[brace] == '{':
+            end = find_matching_brace(text, brace)
+            if end == -1:
+                return None # Accolade non fermée
+            if 'type' in text[brace:end]:
+                return start, end + 1
+        start = text.find('refinementBox', brace)
+    return None
+
+
+def update_refinement_box(geometry, snappy_path: Path, margin=0.1, zmin=0.0, zmax=85, verbose=True):
+    """
+    Met à jour la refinementBox du snappyHexMeshDict autour de `geometry` : les triangles
+    (n, 3, 3) déjà en mémoire, ou le chemin d'un STL (relu seulement dans ce cas).
+    """
+    triangles = geometry if isinstance(geometry, np.ndarray) else load_stl(geometry)
+    bbox_min, bbox_max = bounding_box(triangles)
+
+    dx = bbox_max[0] - bbox_min[0]
+    dy = bbox_max[1] - bbox_min[1]
     diag = math.sqrt(dx**2 + dy**2) * (1 + margin)
 
-    cx = bbox.Center.x
-    cy = bbox.Center.y
+    cx = (bbox_min[0] + bbox_max[0]) / 2
+    cy = (bbox_min[1] + bbox_max[1]) / 2
 
     xmin = int(cx - diag / 2)
     xmax = int(cx + diag / 2)
     ymin = int(cy - diag / 2)
     ymax = int(cy + diag / 2)
 
-    box_string = f"""
-    refinementBox
-    {{
-        type box;
-        min ({xmin:.3f} {ymin:.3f} {zmin:.3f});
-        max ({xmax:.3f} {ymax:.3f} {zmax:.3f});
-    }}"""
-
     text = Path(snappy_path).read_text()
-    # 1. Extraire bloc geometry { ... }
-    pattern = r'refinementBox\s*\{[^}]*?(type\s+[^\n]*;)[^}]*?(min\s+[^\n]*;)[^}]*?(max\s+[^\n]*;)[^}]*?\}'
-    updated_text = re.sub(pattern, box_string, text, count=1, flags=re.DOTALL)
-    Path(snappy_path).write_text(updated_text)
-
-    print(f"✅ refinementBox mise à jour avec une marge de {int(margin*100)}%.")
-
-
-# === Lecture des arguments ===
-
-
-input_path = Path(sys.argv[2])
-output_path = Path(sys.argv[3])
-angle = float(sys.argv[4])
-snappy_path = Path(sys.argv[5])
-
-print(f"🔁 Rotation de {angle}° appliquée à {input_path}")
-print(f"📦 STL sauvegardé dans {output_path}")
-
-# Créer le dossier de sortie si nécessaire
-output_path.parent.mkdir(parents=True, exist_ok=True)
-print("arguments : ", input_path, output_path, angle, snappy_path)
-# Charger le mesh
-mesh = Mesh.Mesh(str(input_path))
-print("✅ STL chargé.")
-# Calcul du centre du mesh (bounding box)
-bbox = mesh.BoundBox
-center_2d_for_rotation = Base.Vector(
-    (bbox.XMin + bbox.XMax) / 2,
-    (bbox.YMin + bbox.YMax) / 2,
-    0    
-)
-# Calculer et imprimer le centre 3D réel de la bounding box
-actual_center_3d = bbox.Center
-print(f"GEOMETRY_CENTER:{actual_center_3d.x},{actual_center_3d.y},{actual_center_3d.z}")
-
-pos = Base.Vector(
-    0, 0, 0
-)
-print("📍 Centre du mesh (pour rotation Z) :", center_2d_for_rotation)
-
-# Définir la rotation autour de Z
-rotation = Base.Rotation(Base.Vector(0, 0, 1), angle)
-
-# Appliquer la rotation autour du centre (rotation sur place)
-placement = Base.Placement(pos,rotation,center_2d_for_rotation) # Utilise le centre 2D pour la rotation Z
-mesh.Placement = placement
-
-print("✅ Rotation sur place appliquée.")
-
-print("✅ Rotation appliquée.")
-# Sauvegarder
-mesh.write(str(output_path))
-print("✅ STL sauvegardé.")
-# Mettre à jour la refinementBox
-update_refinement_box(output_path, snappy_path)
-
+    # 1. Remplacer le bloc refinementBox { ... } en place, le reste du fichier est inchangé
+    block = find_refinement_box(text)
+    if block is not None:
+        start, end = block
+        # Reprendre l'indentation de la ligne du bloc existant
+        indent = text[text.rfind('\n', 0, start) + 1:start]
+        if indent.strip():
+            indent = ""
+        inner = indent + ("\t" if indent.endswith("\t") else "    ")
+        box_string = (
+            f"refinementBox\n"
+            f"{indent}{{\n"
+            f"{inner}type box;\n"
+            f"{inner}min ({xmin:.3f} {ymin:.3f} {zmin:.3f});\n"
+            f"{inner}max ({xmax:.3f} {ymax:.3f} {zmax:.3f});\n"
+            f"{indent}}}"
+        )
+        text = text[:start] + box_string + text[end:]
+    Path(snappy_path).write_text(text)
+
+    if verbose:
+        print(f"✅ refinementBox mise à jour avec une marge de {int(margin*100)}%.")
+
+
+def rotate_batch(base_triangles: np.ndarray, batch: list, verbose=True):
+    """
+    Pour chaque entrée {"angle": ..., "output": ..., "snappy": ...} du lot, écrit dans `output`
+    une copie de `base_triangles` tournée de `angle` degrés autour de Z, puis met à
+    jour la refinementBox du snappyHexMeshDict `snappy` autour de la géométrie tournée.
+
+    Le centre de rotation et les normales du STL de base sont calculés une seule fois, et un seul
+    tableau d'enregistrements STL est rempli puis écrit pour chaque angle : les normales tournent
+    avec les sommets (rotation autour de Z), il n'y a donc pas de produit vectoriel par angle.
+    """
+    center_2d_for_rotation = rotation_center_2d(base_triangles)
+    base_normals = unit_normals(base_triangles)
+    records = np.zeros(len(base_triangles), dtype=STL_RECORD_DTYPE)
+    records["normal"][:, 2] = base_normals[:, 2]
+
+    for entry in batch:
+        angle, output_path, snappy_path = float(entry["angle"]), Path(entry["output"]), Path(entry["snappy"])
+        if verbose:
+            print(f"🔁 Rotation de {angle}° appliquée")
+            print(f"📦 STL sauvegardé dans {output_path}")
+
+        rotate_triangles(base_triangles, angle, center_2d_for_rotation, out=records["vertices"])
+        records["normal"][:, :2] = base_normals[:, :2] @ rotation_matrix_2d(angle).T
+        # Créer le dossier de sortie si nécessaire
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        write_stl_records(records, output_path)
+        if verbose:
+            print("✅ STL sauvegardé.")
+        # Mettre à jour la refinementBox, à partir des sommets tournés (sans relire le STL écrit)
+        update_refinement_box(records["vertices"], snappy_path, verbose=verbose)
+
+
+if __name__ == "__main__":
+    # === Lecture des arguments ===
+    # Lot : python rotate_stl.py <input.stl> <batch.json>
+    #   batch.json : liste de {"angle": ..., "output": ..., "snappy": ...}
+    # Cas unique : python rotate_stl.py <input.stl> <output.stl> <angle> <snappyHexMeshDict>
+    input_path = Path(sys.argv[1])
+    if len(sys.argv) > 3:
+        batch = [{"angle": sys.argv[3], "output": sys.argv[2], "snappy": sys.argv[4]}]
+    else:
+        batch = json.loads(Path(sys.argv[2]).read_text())
+    print("arguments : ", input_path, f"{len(batch)} rotation(s)")
+
+    # Charger le mesh une seule fois pour tout le lot
+    triangles = load_stl(input_path)
+    print("✅ STL chargé.")
+    # Calculer et imprimer le centre 3D réel de la bounding box
+    center = geometry_center(triangles)
+    print(f"GEOMETRY_CENTER:{center['x']},{center['y']},{center['z']}")
+
+    rotate_batch(triangles, batch)
@@ -1,59 +1,223 @@
 import pandas as pd
 import numpy as np
-from scipy.interpolate import griddata, interpn
+from scipy.interpolate import LinearNDInterpolator, RegularGridInterpolator
+from scipy.spatial import Delaunay
+from scipy.ndimage import map_coordinates
 from pathlib import Path
 import plotly.graph_objects as go
+import plotly.colors
 from plotly.subplots import make_subplots
+from PIL import Image
 import sys # Added import for sys
+import functools
 
-def load_and_interpolate(csv_path: Path, grid_shape=(2000, 2000)):
-    df = pd.read_csv(csv_path)
+SLICE_CSV_COLUMNS = ('Points:0', 'Points:1', 'U:0', 'U:1') # Colonnes lues dans le CSV exporté par ParaView
+SLICE_CSV_DTYPES = {'Points:0': np.float64, 'Points:1': np.float64, 'U:0': np.float32, 'U:1': np.float32}
+
+def read_slice(slice_path: Path) -> pd.DataFrame:
+    """
+    Reads a wind slice into a DataFrame with columns x, y (float64) and ux, uy (float32).
+    The coordinates keep their full precision: rounding them to float32 changes the
+    Delaunay triangulation of near-coincident slice points.
+
+    Accepts the `.npz` (binary `points` and `U` arrays, whose first two columns are
+    x, y and Ux, Uy) or CSV exported by ParaView (`slice_and_export.py`) and the
+    `.raw` surface written by OpenFOAM's `surfaces` function object (columns
+    `x y z U_x U_y U_z`).
+    """
+    if Path(slice_path).suffix == '.npz':
+        with np.load(slice_path) as data:
+            points, u = data['points'], data['U']
+        points, u = points.astype(np.float64, copy=False), u.astype(np.float32, copy=False)
+        return pd.DataFrame({'x': points[:, 0], 'y': points[:, 1], 'ux': u[:, 0], 'uy': u[:, 1]})
+
+    # Seules les colonnes utiles sont parsées (z, U_z, p, k, ... sont ignorées)
+    if Path(slice_path).suffix == '.raw':
+        df = pd.read_csv(slice_path, sep=r'\s+', comment='#', header=None, usecols=[0, 1, 3, 4],
+                         dtype={0: np.float64, 1: np.float64, 3: np.float32, 4: np.float32})
+        return df.rename(columns={0: 'x', 1: 'y', 3: 'ux', 4: 'uy'})
+
+    df = pd.read_csv(slice_path, usecols=lambda column: column in SLICE_CSV_COLUMNS, dtype=SLICE_CSV_DTYPES)
     df = df.rename(columns={'Points:0': 'x', 'Points:1': 'y', 'U:0': 'ux'})
     if 'U:1' in df.columns:
         df = df.rename(columns={'U:1': 'uy'})
     else:
-        df['uy'] = 0.0
+        df['uy'] = np.float32(0.0)
+    return df
+
+def load_and_interpolate(csv_path: Path, grid_shape=(2000, 2000), velocity_scale: float = 1.0, roi=None):
+    """
+    Interpole la coupe sur une grille régulière `grid_shape` couvrant la bounding box des points.
+
+    Avec `roi=(center, radius)`, seuls les nœuds du carré de demi-côté `radius` (plus une maille,
+    pour l'interpolation bilinéaire du crop) autour de `center` sont évalués, les autres valent NaN
+    comme hors de l'enveloppe convexe : un crop tourné de taille (w, h) n'échantillonne que le disque
+    de rayon hypot(w, h) / 2 autour de son centre.
+    """
+    df = read_slice(csv_path)
+    if velocity_scale != 1.0: # Champ réutilisé pour une autre vitesse d'entrée (écoulement supposé linéaire en U)
+        df[['ux', 'uy']] *= velocity_scale
 
     x_vec = np.linspace(df.x.min(), df.x.max(), grid_shape[0])
     y_vec = np.linspace(df.y.min(), df.y.max(), grid_shape[1])
-    x_mesh, y_mesh = np.meshgrid(x_vec, y_vec, indexing='ij')
+    x_slice, y_slice = roi_slices(x_vec, y_vec, roi)
+    x_mesh, y_mesh = np.meshgrid(x_vec[x_slice], y_vec[y_slice], indexing='ij')
 
-    ux_grid = griddata(df[['x', 'y']].values, df['ux'].values, (x_mesh, y_mesh), method='linear')
-    uy_grid = griddata(df[['x', 'y']].values, df['uy'].values, (x_mesh, y_mesh), method='linear')
+    points = df[['x', 'y']].to_numpy(np.float64) # Double précision, voir read_slice
+    values = df[['ux', 'uy']].to_numpy(np.float32)
+    interpolator = structured_slice_interpolator(points, values)
+    if interpolator is None:
+        # Une seule triangulation de Delaunay, partagée par les deux composantes
+        interpolator = LinearNDInterpolator(Delaunay(points), values)
+    u_roi = interpolator((x_mesh, y_mesh))
+    # Les interpolateurs scipy calculent en float64 : les grilles 2000x2000 sont gardées en float32
+    ux_grid = np.full(grid_shape, np.nan, dtype=np.float32)
+    uy_grid = np.full(grid_shape, np.nan, dtype=np.float32)
+    ux_grid[x_slice, y_slice] = u_roi[..., 0]
+    uy_grid[x_slice, y_slice] = u_roi[..., 1]
 
     return x_vec, y_vec, ux_grid, uy_grid
 
+def roi_slices(x_vec, y_vec, roi=None):
+    """
+    Tranches d'indices de (x_vec, y_vec) couvrant le carré `roi=(center, radius)` élargi d'une maille,
+    ou toute la grille si `roi` vaut None.
+    """
+    if roi is None:
+        return slice(None), slice(None)
+    (cx, cy), radius = roi
+    dx, dy = x_vec[1] - x_vec[0], y_vec[1] - y_vec[0]
+    x_slice = slice(*np.searchsorted(x_vec, [cx - radius - dx, cx + radius + dx], side='left') + [0, 1])
+    y_slice = slice(*np.searchsorted(y_vec, [cy - radius - dy, cy + radius + dy], side='left') + [0, 1])
+    return x_slice, y_slice
+
+def structured_slice_interpolator(points, values):
+    """
+    Renvoie un RegularGridInterpolator si les points forment une grille cartésienne
+    complète (chaque couple (x, y) unique présent une seule fois), sinon None.
+    """
+    x_unique, x_index = np.unique(points[:, 0], return_inverse=True)
+    y_unique, y_index = np.unique(points[:, 1], return_inverse=True)
+    if len(x_unique) < 2 or len(y_unique) < 2 or len(x_unique) * len(y_unique) != len(points):
+        return None
+    flat_index = x_index * len(y_unique) + y_index
+    if len(np.unique(flat_index)) != len(points):
+        return None
+    grid_values = np.empty((len(x_unique), len(y_unique), values.shape[1]), dtype=values.dtype)
+    grid_values[x_index, y_index] = values
+    return RegularGridInterpolator((x_unique, y_unique), grid_values, method='linear', bounds_error=False, fill_value=np.nan)
+
 def extract_rotated_crop(x_vec, y_vec, ux, uy, center, crop_size, angle_deg, output_res=(2000, 2000)):
     cx, cy = center
     w, h = crop_size
     Nx, Ny = output_res
 
-    # grille dans le repère tourné (ville fixe)
+    # grille dans le repère tourné (ville fixe) : seuls les deux vecteurs 1D sont construits
     x_rel = np.linspace(-w/2, w/2, Nx)
     y_rel = np.linspace(-h/2, h/2, Ny)
-    x_grid, y_grid = np.meshgrid(x_rel, y_rel, indexing='ij')
 
     theta = np.deg2rad(angle_deg)
     cos_t, sin_t = np.cos(theta), np.sin(theta)
 
-    # coordonnées dans le repère global
-    x_rot = cos_t * x_grid - sin_t * y_grid + cx
-    y_rot = sin_t * x_grid + cos_t * y_grid + cy
+    # La grille (x_vec, y_vec) est régulière (linspace) : les coordonnées deviennent des indices
+    # fractionnaires et l'interpolation bilinéaire se fait en C, sans recherche d'intervalle.
+    # Hors grille et autour des NaN, même résultat que interpn(..., fill_value=np.nan).
+    dx, dy = x_vec[1] - x_vec[0], y_vec[1] - y_vec[0]
+
+    # Coordonnées dans le repère global, converties en indices : la rotation et le changement
+    # d'échelle sont affines, donc séparables en une partie en x_rel et une en y_rel, sommées
+    # par broadcasting directement dans l'unique buffer (2, Nx, Ny) passé à map_coordinates
+    # (pas de meshgrid ni de grilles x_rot / y_rot intermédiaires). En float32, l'erreur sur
+    # un indice fractionnaire < 2000 reste sous 1e-4 maille.
+    coords = np.empty((2, Nx, Ny), dtype=np.float32)
+    np.add.outer(x_rel * (cos_t / dx) + (cx - x_vec[0]) / dx, y_rel * (-sin_t / dx), out=coords[0])
+    np.add.outer(x_rel * (sin_t / dy) + (cy - y_vec[0]) / dy, y_rel * (cos_t / dy), out=coords[1])
+
+    ux_crop = map_coordinates(ux, coords, output=np.float32, order=1, mode='constant', cval=np.nan)
+    uy_crop = map_coordinates(uy, coords, output=np.float32, order=1, mode='constant', cval=np.nan)
+
+    return ux_crop, uy_crop
 
-    pts_interp = np.stack([x_rot.ravel(), y_rot.ravel()], axis=-1)
+@functools.lru_cache(maxsize=4)
+def _colorscale_lut(colorscale: str = "RdBu_r", size: int = 256) -> np.ndarray:
+    """Table de couleurs (size, 3) uint8 interpolée linéairement depuis une échelle Plotly."""
+    stops = plotly.colors.get_colorscale(colorscale)
+    positions = [position for position, _ in stops]
+    colors = np.array([plotly.colors.unlabel_rgb(color) for _, color in stops], dtype=np.float64)
+    levels = np.linspace(0.0, 1.0, size)
+    lut = np.stack([np.interp(levels, positions, colors[:, k]) for k in range(3)], axis=-1)
+    lut = np.rint(lut).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
 
-    ux_crop = interpn((x_vec, y_vec), ux, pts_interp, method='linear', bounds_error=False, fill_value=np.nan)
-    uy_crop = interpn((x_vec, y_vec), uy, pts_interp, method='linear', bounds_error=False, fill_value=np.nan)
+def colorize_field(field: np.ndarray, vmin=None, vmax=None, colorscale: str = "RdBu_r") -> np.ndarray:
+    """
+    Convertit un champ 2D (indexé [x, y]) en image RGBA uint8 orientée comme go.Heatmap(z=field.T)
+    (y vers le haut), via une table de couleurs. Les NaN sont transparents ; par défaut
+    l'échelle couvre [min, max] du champ, comme le zauto de Plotly.
+    """
+    z = np.asarray(field, dtype=np.float32).T[::-1]
+    valid = np.isfinite(z)
+    if vmin is None:
+        vmin = float(z[valid].min()) if valid.any() else 0.0
+    if vmax is None:
+        vmax = float(z[valid].max()) if valid.any() else 1.0
+    lut = _colorscale_lut(colorscale)
+    scale = (len(lut) - 1) / (vmax - vmin) if vmax > vmin else 0.0
+    index = np.clip((np.where(valid, z, vmin) - vmin) * scale, 0, len(lut) - 1).astype(np.intp)
+    rgba = np.empty(z.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = lut[index]
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+def save_png_fast(ux_crop, uy_crop, save_path, colorscale: str = "RdBu_r", gap: int = 16):
+    """
+    Écrit Ux et Uy côte à côte dans un PNG avec Pillow (une table de couleurs, sans
+    Plotly ni Kaleido) : quelques dizaines de ms au lieu du rendu Chromium. Chaque
+    composante a sa propre échelle [min, max], sans titres ni colorbars.
+    """
+    ux_img = colorize_field(ux_crop, colorscale=colorscale)
+    uy_img = colorize_field(uy_crop, colorscale=colorscale)
+    height = max(ux_img.shape[0], uy_img.shape[0])
+    canvas = np.zeros((height, ux_img.shape[1] + gap + uy_img.shape[1], 4), dtype=np.uint8)
+    canvas[:ux_img.shape[0], :ux_img.shape[1]] = ux_img
+    canvas[:uy_img.shape[0], ux_img.shape[1] + gap:] = uy_img
+    Image.fromarray(canvas).save(save_path, compress_level=1)
 
-    return ux_crop.reshape(Nx, Ny), uy_crop.reshape(Nx, Ny)
+_UX_UY_FIGURE = None # Figure de plot_ux_uy, construite au premier appel puis réutilisée
 
-def plot_ux_uy(ux_crop, uy_crop, angle_deg, save_path=None): # Added save_path parameter
-    fig = make_subplots(rows=1, cols=2, subplot_titles=[f"Ux (θ={angle_deg}°)", f"Uy (θ={angle_deg}°)"])
+def _ux_uy_figure() -> go.Figure:
+    """Renvoie la figure Ux / Uy (subplots, heatmaps, colorbars), créée une seule fois par processus."""
+    global _UX_UY_FIGURE
+    if _UX_UY_FIGURE is None:
+        fig = make_subplots(rows=1, cols=2, subplot_titles=["Ux", "Uy"])
+        fig.add_trace(go.Heatmap(colorscale="RdBu_r", colorbar=dict(title="Ux")), row=1, col=1)
+        fig.add_trace(go.Heatmap(colorscale="RdBu_r", colorbar=dict(title="Uy")), row=1, col=2)
+        _UX_UY_FIGURE = fig
+    return _UX_UY_FIGURE
 
-    fig.add_trace(go.Heatmap(z=ux_crop.T, colorscale="RdBu_r", colorbar=dict(title="Ux")), row=1, col=1)
-    fig.add_trace(go.Heatmap(z=uy_crop.T, colorscale="RdBu_r", colorbar=dict(title="Uy")), row=1, col=2)
+def plot_ux_uy(ux_crop, uy_crop, angle_deg, save_path=None, fast=False): # Added save_path parameter
+    """
+    Heatmaps Ux / Uy du crop. Avec `save_path` et `fast`, le PNG est rasterisé directement
+    (voir `save_png_fast`) ; sinon la figure Plotly est exportée via Kaleido, ou affichée
+    si `save_path` n'est pas donné.
+    """
+    if save_path and fast:
+        save_png_fast(ux_crop, uy_crop, save_path)
+        return
+
+    fig = _ux_uy_figure()
+    # Seuls les champs et les titres changent d'un rendu à l'autre
+    with fig.batch_update():
+        fig.data[0].z = np.asarray(ux_crop, dtype=np.float32).T
+        fig.data[1].z = np.asarray(uy_crop, dtype=np.float32).T
+        fig.layout.annotations[0].text = f"Ux (θ={angle_deg}°)"
+        fig.layout.annotations[1].text = f"Uy (θ={angle_deg}°)"
+        fig.layout.title.text = f"Vent vu depuis la ville (référentiel fixe, angle={angle_deg}°)" # Updated title
+    if not save_path:
+        fig.show()
+        return
 
-    fig.update_layout(title_text=f"Vent vu depuis la ville (référentiel fixe, angle={angle_deg}°)" ) # Updated title
     img_bytes = fig.to_image(format="png", width=800, height=600)
 
     # Écrire l’image sur disque manuellement
@@ -62,35 +226,55 @@ def plot_ux_uy(ux_crop, uy_crop, angle_deg, save_path=None): # Added save_path p
 
     print("✅ Image sauvegardée via to_image()")
 
-def export_simulated_data_arrays(ux_crop: np.ndarray, uy_crop: np.ndarray, save_prefix_path: Path):
+def incident_components(base_velocity: float, angle_deg: float):
     """
-    Saves the cropped simulated Ux and Uy data arrays as .npy files.
-    No logging or extensive error handling.
-    """
-    np.save(f"{str(save_prefix_path)}_ux_sim.npy", ux_crop)
-    np.save(f"{str(save_prefix_path)}_uy_sim.npy", uy_crop)
-
-def export_incident_data_arrays(base_velocity: float, angle_deg: float, output_resolution: tuple[int, int], save_prefix_path: Path):
-    """
-    Calculates and saves uniform incident Ux and Uy data arrays (relative to geometry) as .npy files.
-    No logging or extensive error handling.
+    Returns the Ux and Uy components (relative to geometry) of the uniform incident wind as float32 scalars.
     """
     theta_rad = np.deg2rad(angle_deg)
-    
-    # Incident wind vector in global frame is (base_velocity, 0)
+
+    # Incident wind vector in global frame is (1, 0)
     # Geometry's x-axis direction: (cos(theta), sin(theta))
     # Geometry's y-axis direction: (-sin(theta), cos(theta))
     # Ux_incident_local = V_global . geometry_x_axis
     # Uy_incident_local = V_global . geometry_y_axis
-    
-    ux_incident_component = base_velocity * np.cos(theta_rad)
-    uy_incident_component = -base_velocity * np.sin(theta_rad) # Wind from X, so Uy relative to geometry is -V*sin(theta)
+    ux_incident = np.float32(base_velocity * np.cos(theta_rad))
+    uy_incident = np.float32(-base_velocity * np.sin(theta_rad)) # Wind from X, so Uy relative to geometry is -V*sin(theta)
+    return ux_incident, uy_incident
 
-    incident_ux_array = np.full(output_resolution, ux_incident_component, dtype=np.float32)
-    incident_uy_array = np.full(output_resolution, uy_incident_component, dtype=np.float32)
+def export_dataset_arrays(ux_crop: np.ndarray, uy_crop: np.ndarray, base_velocity: float, angle_deg: float, save_prefix_path: Path,
+                          velocity_scale: float = None):
+    """
+    Saves the simulated (float32) Ux and Uy arrays of a case along with its incident (float16) Ux and Uy
+    components, its angle and velocity in a single compressed `<prefix>.npz` file, instead of the 4 .npy
+    files and the metadata JSON. The uniform incident fields are stored as (1, 1) arrays: use
+    `load_dataset_arrays` (or `np.broadcast_to(data['ux_incident'], data['ux_sim'].shape)`) to expand them.
+    `velocity_scale` is the factor a case served from the angle cache was scaled by, None for a solved case;
+    it is stored with a `from_angle_cache` flag (scale 1 for a solved case).
+    No logging or extensive error handling.
+    """
+    ux_incident, uy_incident = incident_components(base_velocity, angle_deg)
+    np.savez_compressed(
+        f"{str(save_prefix_path)}.npz",
+        ux_sim=ux_crop.astype(np.float32, copy=False),
+        uy_sim=uy_crop.astype(np.float32, copy=False),
+        ux_incident=np.full((1, 1), ux_incident, dtype=np.float16),
+        uy_incident=np.full((1, 1), uy_incident, dtype=np.float16),
+        angle_deg=np.float64(angle_deg),
+        velocity_mps=np.float64(base_velocity),
+        from_angle_cache=np.bool_(velocity_scale is not None),
+        velocity_scale=np.float64(1.0 if velocity_scale is None else velocity_scale),
+    )
 
-    np.save(f"{str(save_prefix_path)}_ux_incident.npy", incident_ux_array)
-    np.save(f"{str(save_prefix_path)}_uy_incident.npy", incident_uy_array)
+def load_dataset_arrays(npz_path: Path) -> dict:
+    """
+    Loads a `<prefix>.npz` written by `export_dataset_arrays`, with the incident components
+    broadcast (read-only, without copy) to the shape of the simulated arrays.
+    """
+    with np.load(npz_path) as data:
+        arrays = {key: data[key] for key in data.files}
+    for key in ('ux_incident', 'uy_incident'):
+        arrays[key] = np.broadcast_to(arrays[key], arrays['ux_sim'].shape)
+    return arrays
 
 # --- Exemple d'utilisation ---
 if __name__ == "__main__":